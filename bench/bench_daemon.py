@@ -0,0 +1,57 @@
+#
+# Solve a stream of tiny models against the local NEOS stand-in, once with
+# the regular client and once through gmske_dc.py and a running daemon, and
+# report the time per solve.  The result cache is off, so every solve is
+# submitted.
+#
+#   python bench/bench_daemon.py [solves]
+#
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.join(root,'tests'))
+
+import standin
+
+def solve(command):
+  result = subprocess.run(command,capture_output=True,text=True)
+  if result.returncode != 0:
+    sys.exit("solve failed (%d): %s" % (result.returncode,result.stderr))
+
+def main(solves):
+  neos = standin.StandinNeos()
+  (server,url) = standin.start(neos)
+  work = tempfile.mkdtemp(prefix='kestrel-bench-')
+  try:
+    cntr = standin.makeJob(os.path.join(work,'job'),url,"kestrel_cache 0\n")
+    client = os.path.join(root,'gmske_nx.py')
+    socketPath = os.path.join(work,'daemon.sock')
+    daemon = subprocess.Popen([sys.executable,client,'--daemon',socketPath],
+                              stdout=subprocess.PIPE,text=True)
+    daemon.stdout.readline()
+    commands = [('direct',[sys.executable,client,cntr]),
+                ('daemon',[sys.executable,os.path.join(root,'gmske_dc.py'),socketPath,client,cntr])]
+    try:
+      for (name,command) in commands:
+        start = time.time()
+        for i in range(solves):
+          solve(command)
+        elapsed = time.time()-start
+        print("%-7s %d solves in %.2f s, %.1f ms/solve" % (name+':',solves,elapsed,1000*elapsed/solves))
+    finally:
+      daemon.terminate()
+      daemon.wait()
+    print("%d submissions, %d pings, %d solver lists" % \
+          (len(neos.submitted),neos.count('ping'),neos.count('listSolversInCategory')))
+  finally:
+    server.shutdown()
+    shutil.rmtree(work,ignore_errors=True)
+
+if __name__=="__main__":
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,71 @@
+#
+# Stress test for large submissions: builds a job with a big empinfo file
+# and a big option file full of ']]>' sequences, then measures time and peak
+# Python memory (tracemalloc) of formSubmission and of the submission to a
+# NEOS stand-in running in another process.
+#
+#   python bench/bench_submission.py [empinfo lines] [option lines]
+#
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import tracemalloc
+import xmlrpc.client
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,root)
+sys.path.insert(0,os.path.join(root,'tests'))
+
+import standin
+import gmske_nx
+
+def main(empinfoLines,optionLines):
+  server = subprocess.Popen([sys.executable,os.path.join(root,'tests','standin.py')],
+                            stdout=subprocess.PIPE,text=True)
+  url = server.stdout.readline().strip()
+  work = tempfile.mkdtemp(prefix='kestrel-bench-')
+  try:
+    job = os.path.join(work,'job')
+    cntr = standin.makeJob(job,url,"kestrel_cache 0\n")
+    with open(os.path.join(job,'empinfo.dat'),'wb') as f:
+      for i in range(empinfoLines):
+        f.write(b"jrandvar s%07d x%07d 0.5 0.25\n" % (i,i))
+    with open(os.path.join(job,'kestrel.opt'),'a') as f:
+      for i in range(optionLines):
+        f.write("opt%06d value ]]> %d\n" % (i,i))
+    print("empinfo %.1f MB, options %.1f MB" % \
+          (os.path.getsize(os.path.join(job,'empinfo.dat'))/1e6,os.path.getsize(os.path.join(job,'kestrel.opt'))/1e6))
+
+    client = gmske_nx.KestrelGamsClient(['gmske_nx.py',cntr])
+    client.parseControlFile()
+    client.logopt = 0
+    client.parseOptionsFile()
+    client.obtainSolvers()
+
+    tracemalloc.start()
+    start = time.time()
+    client.formSubmission()
+    formed = time.time()
+    (current,formPeak) = tracemalloc.get_traced_memory()
+    client.submit()
+    submitted = time.time()
+    (current,peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("formSubmission: %.2f s, peak %.1f MB" % (formed-start,formPeak/1e6))
+    print("submission:     %.2f s, peak %.1f MB, request body %.1f MB" % \
+          (submitted-formed,peak/1e6,client.metrics['upload_bytes']/1e6))
+    (size,error) = xmlrpc.client.ServerProxy(url).checkSubmission(client.jobNumber)
+    print("document %.1f MB as received, %s" % (size/1e6,"parse error: " + error if error else "well-formed"))
+  finally:
+    server.terminate()
+    server.wait()
+    shutil.rmtree(work,ignore_errors=True)
+
+if __name__=="__main__":
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 800000,
+       int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
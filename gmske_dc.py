@@ -0,0 +1,81 @@
+#
+#MIT License
+#
+#Copyright (c) 2020 NEOS-Server
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+#
+
+# Thin launcher for a Kestrel daemon started with
+#   python gmske_nx.py --daemon <socket>
+# It hands the control file and its stdout/stderr to the daemon and waits for
+# the solve to finish.  Only cheap modules are imported here on purpose.
+# If the daemon is not running, the regular client is started instead.
+#
+#   gmske_dc.py <socket> <client script> <cntrfile>
+
+import os
+import sys
+import json
+import socket
+import signal
+
+def fallback(client, cntrfile):
+  sys.stdout.flush()
+  os.execv(sys.executable, [sys.executable, client, cntrfile])
+
+if __name__=="__main__":
+  if len(sys.argv) < 4:
+    sys.stderr.write("\n--- Kestrel fatal error: usage\n")
+    sys.stderr.write("  gmske_dc.py <socket> <client script> <cntrfile>\n")
+    sys.exit(1)
+  (socketPath, client, cntrfile) = sys.argv[1:4]
+
+  conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    conn.connect(socketPath)
+  except OSError:
+    fallback(client, cntrfile)
+
+  request = {'cntr': os.path.abspath(cntrfile),
+             'cwd': os.getcwd(),
+             'env': dict(os.environ)}
+  # One JSON line; a large environment may take more than one send
+  data = json.dumps(request).encode() + b"\n"
+  sent = socket.send_fds(conn, [data], [sys.stdout.fileno(), sys.stderr.fileno()])
+  conn.sendall(data[sent:])
+
+  def terminate(signum, frame):
+    conn.sendall(b"TERM\n")
+  signal.signal(signal.SIGTERM, terminate)
+
+  reply = b""
+  while not reply.endswith(b"\n"):
+    try:
+      data = conn.recv(64)
+    except KeyboardInterrupt:
+      # Let the job handle the interrupt like a local client would
+      conn.sendall(b"INT\n")
+      continue
+    if not data:
+      sys.stderr.write("\n--- Kestrel fatal error: lost connection to daemon %s\n\n" % socketPath)
+      sys.exit(1)
+    reply += data
+  conn.close()
+  sys.exit(int(reply))
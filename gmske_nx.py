@@ -40,6 +40,20 @@ import xml.dom.minidom
 import string
 import pathlib
 import ssl
+import threading
+import queue
+import http.client
+import hashlib
+import random
+import json
+import signal
+import selectors
+import tempfile
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+  import msvcrt
 import certifi
 
 solverMap = {}
@@ -59,6 +73,17 @@ solverMap[13] = 'shot'   # miqcp
 solverMap[14] = 'ipopt'  # rmiqcp
 solverMap[15] = 'jams'   # emp
 
+modelTypes = ['', 'lp', 'mip', 'rmip', 'nlp', 'mcp', 'mpec', 'rmpec', 'cns',
+              'dnlp', 'rminlp', 'minlp', 'qcp', 'miqcp', 'rmiqcp', 'emp']
+
+# Model statistics from the control file that kestrel_route rules can test
+# besides modeltype
+routeStats = ['rows','cols','nz','nlnz','discrete']
+
+# Rule table used with 'kestrel_routing 1' when no 'kestrel_route' is given:
+# <condition>[,<condition>...] <priority>|- [<solver>]
+defaultRoutes = ['rows<=5000,cols<=5000,nz<=50000,discrete<=100 short']
+
 class KestrelException(Exception):
   def __init__(self,msg):
     Exception.__init__(self)
@@ -67,6 +92,14 @@ class KestrelException(Exception):
   def __str__(self):
     return repr(self.msg)
 
+class KestrelInterrupt(Exception):
+  """
+  Raised by the SIGTERM handler while waiting for a job
+  """
+  def __init__(self,msg):
+    Exception.__init__(self)
+    self.msg = msg
+
 class KestrelSolverException(KestrelException):
   def __init__(self,msg,solverlist):
     KestrelException.__init__(self,msg)
@@ -76,13 +109,726 @@ class KestrelSolverException(KestrelException):
     for solver in solverlist:
       self.msg += solver.upper() +"\n"
 
+# Errors that indicate a failed or broken connection to an endpoint rather
+# than an error reported by NEOS itself (xmlrpc.client.Fault)
+transportErrors = (OSError, xmlrpc.client.ProtocolError, http.client.HTTPException)
+
+# Errors raised before a request reached the server; repeating the request
+# is safe even if it is not idempotent
+unsentErrors = (ConnectionRefusedError, socket.gaierror)
+
+def backoffDelay(attempt,base):
+  """
+  Seconds to wait before retry number attempt (1, 2, ...): exponential
+  backoff with full jitter, capped at one minute
+  """
+  return random.uniform(0,min(60.0,base*2**(attempt-1)))
+
+def prometheusLabel(value):
+  """
+  Escapes a label value for the Prometheus text format
+  """
+  return str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+class KestrelProgress:
+  """
+  Follows one transfer: writes bytes, MB/s and ETA to log every interval
+  seconds and, with maxRate > 0, paces the transfer to maxRate bytes per
+  second (a token bucket holding one chunk).
+  """
+  def __init__(self,label,total,log,interval,maxRate=0):
+    self.label=label
+    self.total=total
+    self.log=log
+    self.interval=interval
+    self.maxRate=maxRate
+    self.start=self.last=time.time()
+    self.done=0
+    self.reported=False
+
+  def update(self,count):
+    self.done += count
+    now = time.time()
+    if self.maxRate > 0:
+      ahead = self.done/self.maxRate - (now - self.start)
+      if ahead > 0:
+        time.sleep(ahead)
+        now = time.time()
+    if self.interval > 0 and now - self.last >= self.interval:
+      self.last = now
+      self.reported = True
+      rate = self.done/max(now - self.start,1e-6)
+      msg = "%s: %.1f" % (self.label,self.done/1e6)
+      if self.total:
+        msg += " of %.1f MB, %.2f MB/s, ETA %.0f s" % (self.total/1e6,rate/1e6,(self.total - self.done)/max(rate,1e-6))
+      else:
+        msg += " MB, %.2f MB/s" % (rate/1e6)
+      self.log(msg + self.limit() + "\n")
+
+  def finish(self):
+    if self.reported:
+      elapsed = time.time() - self.start
+      self.log("%s: %.1f MB in %.1f s, %.2f MB/s%s\n" % \
+               (self.label,self.done/1e6,elapsed,self.done/1e6/max(elapsed,1e-6),self.limit()))
+
+  def limit(self):
+    if self.maxRate > 0:
+      return " (limited to %.0f KB/s by kestrel_max_upload_rate)" % (self.maxRate/1024)
+    return ""
+
+class KestrelTransportMixin:
+  """
+  Sends and receives XML-RPC bodies in chunks so that large submissions and
+  results report their progress.  Only uploads are rate limited.
+  """
+  chunkSize = 65536
+  log = None
+  interval = 0
+  maxUploadRate = 0
+
+  def request(self,host,handler,request_body,verbose=False):
+    # Like xmlrpc.client, repeat a request once if the reused keep-alive
+    # connection turns out to have been closed while idle.  Requests on a
+    # new connection are never repeated here; KestrelServerPool knows which
+    # calls are safe to repeat, and submissions always use a new connection.
+    if self._connection[1] is not None and self._connection[0] == host:
+      return super().request(host,handler,request_body,verbose)
+    return self.single_request(host,handler,request_body,verbose)
+
+  def send_content(self,connection,request_body):
+    connection.putheader("Content-Length", str(len(request_body)))
+    connection.endheaders()
+    progress = KestrelProgress("Upload",len(request_body),self.log,self.interval,self.maxUploadRate)
+    if isinstance(request_body,KestrelRequestBody):
+      chunks = request_body.chunks(self.chunkSize)
+    else:
+      view = memoryview(request_body)
+      chunks = [view[start:start+self.chunkSize] for start in range(0,len(request_body),self.chunkSize)]
+    for chunk in chunks:
+      connection.send(chunk)
+      progress.update(len(chunk))
+    progress.finish()
+
+  def parse_response(self,response):
+    if response.getheader("Content-Encoding", "") == "gzip":
+      stream = xmlrpc.client.GzipDecodedResponse(response)
+    else:
+      stream = response
+    total = int(response.getheader("Content-Length", "0") or 0)
+    progress = KestrelProgress("Download",total,self.log,self.interval)
+
+    (p,u) = self.getparser()
+    while True:
+      data = stream.read(self.chunkSize)
+      if not data:
+        break
+      progress.update(len(data))
+      p.feed(data)
+    progress.finish()
+
+    if stream is not response:
+      stream.close()
+    p.close()
+    return u.close()
+
+class KestrelTransport(KestrelTransportMixin,xmlrpc.client.Transport):
+  pass
+
+class KestrelSafeTransport(KestrelTransportMixin,xmlrpc.client.SafeTransport):
+  pass
+
+class KestrelEndpoint:
+  """
+  A single NEOS XML-RPC endpoint together with its latency statistics.
+  Idle proxies are kept so that connections are reused between calls.
+  """
+  def __init__(self,protocol,host,port,context,log=None,interval=0,maxUploadRate=0):
+    self.protocol=protocol
+    self.host=host
+    self.port=port
+    self.url="%s://%s:%s" % (protocol,host,port)
+    self.hostport="%s:%s" % (host,port)
+    self.context=context
+    self.log=log
+    self.interval=interval
+    self.maxUploadRate=maxUploadRate
+    self.idle=[]
+    self.lock=threading.Lock()
+    self.calls=0
+    self.failures=0
+    self.faults=0
+    self.hedgeWins=0
+    self.totalTime=0.0
+    self.maxTime=0.0
+
+  def call(self,method,args,fresh=False):
+    """
+    Calls method on an idle proxy, or on a new one (with a new connection)
+    if there is none or fresh is set
+    """
+    with self.lock:
+      proxy = self.idle.pop() if self.idle and not fresh else None
+    if proxy is None:
+      if self.protocol == "https":
+        transport = KestrelSafeTransport(context=self.context)
+      else:
+        transport = KestrelTransport()
+      (transport.log,transport.interval,transport.maxUploadRate) = (self.log,self.interval,self.maxUploadRate)
+      proxy = xmlrpc.client.ServerProxy(self.url, transport=transport)
+    start = time.time()
+    try:
+      if [arg for arg in args if isinstance(arg,KestrelDocumentWriter)]:
+        result = self.send(proxy,method,args)
+      else:
+        result = getattr(proxy,method)(*args)
+    except xmlrpc.client.Fault:
+      # The server answered, so the connection is still good
+      self.record(time.time()-start,True,fault=True)
+      with self.lock:
+        self.idle.append(proxy)
+      raise
+    except transportErrors:
+      self.record(time.time()-start,False)
+      proxy("close")()
+      raise
+    self.record(time.time()-start,True)
+    with self.lock:
+      self.idle.append(proxy)
+    return result
+
+  def send(self,proxy,method,args):
+    """
+    Calls method with a document argument streamed from its spool file
+    """
+    response = proxy("transport").request(self.hostport,"/RPC2",KestrelRequestBody(method,args))
+    if len(response) == 1:
+      response = response[0]
+    return response
+
+  def record(self,elapsed,success,fault=False):
+    with self.lock:
+      self.calls += 1
+      if not success:
+        self.failures += 1
+      if fault:
+        self.faults += 1
+      self.totalTime += elapsed
+      self.maxTime = max(self.maxTime,elapsed)
+
+class KestrelServerPool:
+  """
+  Dispatches NEOS calls over a list of endpoints.
+
+  The endpoints are health-checked with ping() on connect and the first
+  alive one becomes active.  Calls that fail on the transport level are
+  repeated on the next endpoint, except for submissions which must not run
+  twice.  Idempotent polling calls are hedged: if the active endpoint has
+  not answered within hedgeDelay seconds the same call is sent to the next
+  endpoint and the first reply wins.
+  """
+  submitMethods = ['submitJob','authenticatedSubmitJob']
+  hedgedMethods = ['getJobStatus','getIntermediateResults']
+
+  def __init__(self,endpoints,hedgeDelay,log,throttle=None):
+    self.endpoints=endpoints
+    self.hedgeDelay=hedgeDelay
+    self.log=log
+    self.throttle=throttle
+    self.hedges=0
+    self.retries=0
+    self.maxRetries=5
+    self.retryDelay=1.0
+    self.healthy=len(endpoints)
+
+  def __getattr__(self,method):
+    if method.startswith('_'):
+      raise AttributeError(method)
+    return lambda *args: self.call(method,args)
+
+  def assume(self,alive):
+    # Take the health check result from an earlier connect()
+    self.endpoints = [e for e in self.endpoints if e.url in alive] + \
+                     [e for e in self.endpoints if e.url not in alive]
+    self.healthy = len([e for e in self.endpoints if e.url in alive])
+
+  def connect(self):
+    alive = []
+    dead = []
+    for endpoint in self.endpoints:
+      self.log("Connecting to: %s\n" % endpoint.url)
+      try:
+        reply = endpoint.call('ping',())
+      except (transportErrors + (xmlrpc.client.Fault,)) as e:
+        self.log("NEOS at %s is not responding: %s\n" % (endpoint.url,e))
+        dead.append(endpoint)
+        continue
+      if reply.find('alive') < 0:
+        self.log("NEOS at %s is not alive\n" % endpoint.url)
+        dead.append(endpoint)
+      else:
+        alive.append(endpoint)
+    if not alive:
+      raise KestrelException("Unable to contact NEOS at %s" % \
+            ", ".join([endpoint.url for endpoint in self.endpoints]))
+    self.endpoints = alive + dead
+    self.healthy = len(alive)
+
+  def failover(self,endpoint,error):
+    """
+    Moves a failed endpoint to the end of the list.  Returns False if no
+    other endpoint is considered healthy; all endpoints then get another
+    chance.
+    """
+    if endpoint in self.endpoints[:self.healthy]:
+      self.endpoints.remove(endpoint)
+      self.endpoints.append(endpoint)
+      self.healthy -= 1
+    if self.healthy > 0:
+      self.log("\nNEOS at %s failed (%s); switching to %s\n" % \
+               (endpoint.url,error,self.endpoints[0].url))
+      return True
+    self.healthy = len(self.endpoints)
+    return False
+
+  def call(self,method,args):
+    """
+    Calls method on the active endpoint.  Transport failures are retried on
+    the next healthy endpoint right away, or with jittered backoff once all
+    endpoints have failed, up to maxRetries times.  A submission is only
+    repeated if it certainly never reached the server.
+    """
+    if self.throttle:
+      self.throttle()
+    attempt = 0
+    while True:
+      endpoint = self.endpoints[0]
+      hedged = method in self.hedgedMethods and self.hedgeDelay > 0 and self.healthy > 1
+      try:
+        if hedged:
+          return self.hedgedCall(method,args)
+        # A submission on an idle connection could fail because the server
+        # closed it, and could then not be repeated
+        return endpoint.call(method,args,method in self.submitMethods)
+      except transportErrors as e:
+        error = e
+      if method in self.submitMethods and not isinstance(error,unsentErrors):
+        raise error
+      attempt += 1
+      if attempt > self.maxRetries:
+        raise error
+      self.retries += 1
+      # hedgedCall has already moved the failed endpoints aside
+      if hedged or not self.failover(endpoint,error):
+        delay = backoffDelay(attempt,self.retryDelay)
+        self.log("\nNEOS call %s failed (%s); retry %d/%d in %.1f s\n" % \
+                 (method,error,attempt,self.maxRetries,delay))
+        time.sleep(delay)
+
+  def hedgedCall(self,method,args):
+    replies = queue.Queue()
+    def run(endpoint):
+      try:
+        replies.put((endpoint,endpoint.call(method,args),None))
+      except Exception as e:
+        replies.put((endpoint,None,e))
+
+    # Daemon threads, so a hung request never blocks interpreter exit
+    candidates = self.endpoints[:2]
+    threading.Thread(target=run,args=(candidates[0],),daemon=True).start()
+    pending = 1
+    try:
+      reply = replies.get(timeout=self.hedgeDelay)
+    except queue.Empty:
+      self.hedges += 1
+      threading.Thread(target=run,args=(candidates[1],),daemon=True).start()
+      pending = 2
+      reply = replies.get()
+    while True:
+      (endpoint,result,error) = reply
+      pending -= 1
+      if error is None:
+        if endpoint is not candidates[0]:
+          endpoint.hedgeWins += 1
+        return result
+      if not isinstance(error,transportErrors) or pending == 0:
+        # call() retries when both attempts failed
+        raise error
+      self.failover(endpoint,error)
+      reply = replies.get()
+
+  def logStats(self):
+    self.log("\nNEOS endpoint statistics (%d hedged request(s)):\n" % self.hedges)
+    for endpoint in self.endpoints:
+      if endpoint.calls:
+        self.log("  %s: %d call(s), %d failed, %d fault(s), avg %.1f ms, max %.1f ms, %d hedge win(s)\n" % \
+                 (endpoint.url,endpoint.calls,endpoint.failures,endpoint.faults,
+                  1000.0*endpoint.totalTime/endpoint.calls,1000.0*endpoint.maxTime,
+                  endpoint.hedgeWins))
+
+class KestrelResultCache:
+  """
+  Local cache of final NEOS results keyed by a fingerprint of the submission.
+
+  Every entry is the gzipped result document returned by getFinalResults.
+  The modification time of an entry is its last use; the least recently
+  used entries are removed once the cache grows beyond maxSize bytes.
+  """
+  def __init__(self,directory,maxSize):
+    self.directory=directory
+    self.maxSize=maxSize
+
+  def entryName(self,key):
+    return os.path.join(self.directory, key + ".xml.gz")
+
+  def lookup(self,key):
+    fname = self.entryName(key)
+    try:
+      with gzip.open(fname,'rb') as f:
+        data = f.read()
+      os.utime(fname)
+    except (OSError, EOFError):
+      return None
+    return data
+
+  def store(self,key,data):
+    os.makedirs(self.directory,exist_ok=True)
+    fname = self.entryName(key)
+    tmpname = "%s.%d.tmp" % (fname,os.getpid())
+    with gzip.open(tmpname,'wb') as f:
+      f.write(data)
+    os.replace(tmpname,fname)
+    self.evict()
+
+  def evict(self):
+    entries = []
+    total = 0
+    for name in os.listdir(self.directory):
+      if not name.endswith(".xml.gz"):
+        continue
+      try:
+        st = os.stat(os.path.join(self.directory,name))
+      except OSError:
+        continue
+      entries.append((st.st_mtime,st.st_size,name))
+      total += st.st_size
+    entries.sort()
+    for (mtime,size,name) in entries:
+      if total <= self.maxSize:
+        break
+      try:
+        os.unlink(os.path.join(self.directory,name))
+      except OSError:
+        pass
+      total -= size
+
+def updateLocked(fname,change):
+  """
+  Calls change(state) on the JSON document in fname while holding an
+  exclusive lock on the file, then writes the state back.  Returns the
+  result of change.
+  """
+  with open(fname,'a+') as f:
+    # msvcrt locks bytes from the current position, which 'a+' puts at the
+    # end of the file; lock and unlock the first byte
+    f.seek(0)
+    if fcntl:
+      fcntl.flock(f,fcntl.LOCK_EX)
+    else:
+      msvcrt.locking(f.fileno(),msvcrt.LK_LOCK,1)
+    try:
+      f.seek(0)
+      try:
+        state = json.loads(f.read() or "{}")
+      except ValueError:
+        state = {}
+      result = change(state)
+      f.seek(0)
+      f.truncate()
+      f.write(json.dumps(state))
+      f.flush()
+    finally:
+      if fcntl:
+        fcntl.flock(f,fcntl.LOCK_UN)
+      else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(),msvcrt.LK_UNLCK,1)
+  return result
+
+class KestrelScheduler:
+  """
+  Coordinates all Kestrel clients of one account that share a directory.
+
+  The state lives in <directory>/<account>.json and is only touched while
+  holding an exclusive lock on that file.  It holds a token bucket that
+  limits NEOS requests to rate per second (bursts up to burst), the jobs
+  currently running and the queue of clients waiting for one of the
+  maxJobs job slots.  The queue is ordered by priority, then arrival.
+
+  While a client is queued or holds a slot it refreshes a heartbeat every
+  heartbeatInterval seconds.  Entries of processes that died on this host
+  are dropped right away, entries from other hosts once their heartbeat is
+  older than heartbeatTimeout seconds.
+  """
+  priorities = {'short': 0, 'long': 1}
+  heartbeatInterval = 30
+  heartbeatTimeout = 300
+
+  def __init__(self,directory,account,rate,burst,maxJobs):
+    self.directory=directory
+    self.fname=os.path.join(directory, re.sub(r'[^\w.-]','_',account) + ".json")
+    self.rate=rate
+    self.burst=max(burst,1)
+    self.maxJobs=maxJobs
+    self.host=socket.gethostname()
+    self.ticket="%s:%d:%f" % (self.host,os.getpid(),time.time())
+    self.delayed=0
+    self.throttleWait=0.0
+    self.heartbeat=None
+
+  def update(self,change):
+    """
+    Calls change(state) under the lock and saves the state afterwards
+    """
+    def withDefaults(state):
+      state.setdefault('tokens',float(self.burst))
+      state.setdefault('updated',time.time())
+      state.setdefault('jobs',{})
+      state.setdefault('queue',[])
+      state.setdefault('beats',{})
+      return change(state)
+    os.makedirs(self.directory,exist_ok=True)
+    return updateLocked(self.fname,withDefaults)
+
+  def isAlive(self,ticket,beats):
+    (host,pid,started) = ticket.rsplit(':',2)
+    if host != self.host or not fcntl:
+      return time.time() - beats.get(ticket,float(started)) < self.heartbeatTimeout
+    try:
+      os.kill(int(pid),0)
+    except ProcessLookupError:
+      return False
+    except OSError:
+      pass
+    return True
+
+  def beat(self,state):
+    state['beats'][self.ticket] = time.time()
+
+  def keepBeating(self,stop):
+    while not stop.wait(self.heartbeatInterval):
+      try:
+        self.update(self.beat)
+      except OSError:
+        pass
+
+  def throttle(self):
+    """
+    Takes a token for one NEOS request, waiting for it if necessary
+    """
+    def take(state):
+      now = time.time()
+      state['tokens'] = min(self.burst, state['tokens'] + (now - state['updated'])*self.rate)
+      state['updated'] = now
+      if state['tokens'] >= 1:
+        state['tokens'] -= 1
+        return 0.0
+      return (1 - state['tokens'])/self.rate
+
+    if self.rate <= 0:
+      return
+    first = True
+    while True:
+      wait = self.update(take)
+      if wait <= 0:
+        return
+      if first:
+        self.delayed += 1
+        first = False
+      self.throttleWait += wait
+      time.sleep(wait)
+
+  def acquireSlot(self,priority):
+    """
+    Waits for one of the maxJobs job slots; returns (seconds waited, number of
+    clients that were ahead in the queue on arrival)
+    """
+    def prune(state):
+      beats = state['beats']
+      state['jobs'] = dict([(t,job) for (t,job) in state['jobs'].items() if self.isAlive(t,beats)])
+      state['queue'] = [entry for entry in state['queue'] if self.isAlive(entry['ticket'],beats)]
+      state['queue'].sort(key=lambda entry: (entry['priority'],entry['time']))
+      active = set(state['jobs']) | set([entry['ticket'] for entry in state['queue']])
+      state['beats'] = dict([(t,beat) for (t,beat) in beats.items() if t in active])
+
+    def enqueue(state):
+      prune(state)
+      self.beat(state)
+      entry = {'ticket': self.ticket, 'priority': self.priorities.get(priority,1), 'time': time.time()}
+      state['queue'].append(entry)
+      state['queue'].sort(key=lambda entry: (entry['priority'],entry['time']))
+      return state['queue'].index(entry) + len(state['jobs'])
+
+    def admit(state):
+      prune(state)
+      self.beat(state)
+      if len(state['jobs']) < self.maxJobs and state['queue'][0]['ticket'] == self.ticket:
+        state['queue'].pop(0)
+        state['jobs'][self.ticket] = {'priority': priority}
+        return True
+      return False
+
+    if self.maxJobs <= 0:
+      return (0.0,0)
+    start = time.time()
+    ahead = self.update(enqueue)
+    stop = threading.Event()
+    self.heartbeat = (stop,threading.Thread(target=self.keepBeating,args=(stop,),daemon=True))
+    self.heartbeat[1].start()
+    while not self.update(admit):
+      time.sleep(0.5)
+    return (time.time() - start,ahead)
+
+  def releaseSlot(self):
+    """
+    Gives up the slot or the place in the queue; does nothing if this client
+    holds neither
+    """
+    def release(state):
+      state['jobs'].pop(self.ticket,None)
+      state['queue'] = [entry for entry in state['queue'] if entry['ticket'] != self.ticket]
+      state['beats'].pop(self.ticket,None)
+    if self.heartbeat:
+      self.heartbeat[0].set()
+      self.heartbeat = None
+    if self.maxJobs > 0:
+      self.update(release)
+
+class KestrelDocumentWriter:
+  """
+  Collects the submission document piece by piece in a spool file that
+  moves to disk once it grows beyond spoolSize bytes.  The document is kept
+  in the form it takes as a string argument of an XML-RPC call (escaped and
+  UTF-8 encoded), so it can be sent in chunks by KestrelRequestBody without
+  ever holding the document or the request in memory.
+  """
+  chunkSize = 3*65536
+  spoolSize = 4*1024*1024
+
+  def __init__(self):
+    self.file = tempfile.SpooledTemporaryFile(max_size=self.spoolSize)
+    self.size = 0
+
+  def __len__(self):
+    return self.size
+
+  def write(self,text):
+    data = xmlrpc.client.escape(text).encode('utf-8','xmlcharrefreplace')
+    self.file.write(data)
+    self.size += len(data)
+
+  def writeCData(self,text):
+    # ']]>' would end the CDATA section; split it over two sections
+    self.write(text.replace("]]>","]]]]><![CDATA[>"))
+
+  def writeBase64(self,tag,f):
+    """
+    Writes the contents of the binary file f base64 encoded in <tag>; returns
+    the number of bytes read
+    """
+    # Encode in chunks of a multiple of three bytes so no padding is inserted
+    count = 0
+    f.seek(0)
+    self.write("<%s><base64>" % tag)
+    for chunk in iter(lambda: f.read(self.chunkSize), b""):
+      self.write(base64.b64encode(chunk).decode())
+      count += len(chunk)
+    self.write("</base64></%s>\n" % tag)
+    return count
+
+  def chunks(self,size):
+    self.file.seek(0)
+    return iter(lambda: self.file.read(size), b"")
+
+  def close(self):
+    self.file.close()
+
+class KestrelRequestBody:
+  """
+  The body of an XML-RPC call of method whose arguments include a
+  KestrelDocumentWriter.  The rest of the call is marshalled as usual and
+  the document is streamed from its spool file in between.
+  """
+  marker = "@@kestrel-document@@"
+
+  def __init__(self,method,args):
+    self.document = [arg for arg in args if isinstance(arg,KestrelDocumentWriter)][0]
+    params = tuple([self.marker if arg is self.document else arg for arg in args])
+    (head,tail) = xmlrpc.client.dumps(params,method).split(self.marker)
+    self.head = head.encode('utf-8','xmlcharrefreplace')
+    self.tail = tail.encode('utf-8','xmlcharrefreplace')
+
+  def __len__(self):
+    return len(self.head) + len(self.document) + len(self.tail)
+
+  def chunks(self,size):
+    yield self.head
+    for chunk in self.document.chunks(size):
+      yield chunk
+    yield self.tail
+
 class KestrelGamsClient:
+  # State that survives between solves when running inside KestrelDaemon:
+  # the SSL context and, per list of endpoints, the endpoints found alive
+  # and the solvers offered
+  sslContext=None
+  catalog={}
+  catalogTimeout=600
+  # Model status values of a solved model: optimal, locally optimal, integer
+  # solution, solved unique, solved and solved singular
+  solvedModelStatus=[1,2,8,15,16,17]
+  # Seconds between status polls
+  pollInterval=5
+
   def __init__(self,argv):
     self.argv=argv
     self.serverProtocol="https"
     self.serverHost="neos-server.org"
     self.serverPort=3333
+    self.serverList=[]
+    self.hedgeDelay=2.0
+    self.useCache=True
+    self.cacheDir=None
+    self.cacheSize=256
+    self.cacheKey=None
+    self.document=None
+    self.warmStart=False
+    self.warmStartFile=None
+    self.warmStartSize=0
+    self.submitTime=None
+    self.requestRate=0.0
+    self.requestBurst=5
+    self.maxJobs=0
+    self.schedDir=None
+    self.scheduler=None
+    self.scenarioStream=False
+    self.routing=False
+    self.routes=[]
+    self.explicitPriority=False
+    self.explicitSolver=False
+    self.deadline=0
+    self.metricsFile=None
+    self.maxRetries=5
+    self.retryDelay=1.0
+    self.prometheusFile=None
+    self.metrics={}
+    self.interruptAction="kill"
+    self.progressInterval=10.0
+    self.maxUploadRate=0.0
+    self.streamBuffer=""
+    self.scenariosReceived=0
     self.solverName=None
+    self.neos=None
+    self.catalogKey=None
     self.jobNumber=None
     self.password=None
     self.priority="long"
@@ -90,18 +836,13 @@ class KestrelGamsClient:
     self.authUsername=None
     self.authUserPassword=None
 
-    # action-parameter is outdated
-    '''
+    # the action parameter is optional, solve is the default
     if len(self.argv) >= 3:
       self.cntrfile = self.argv[2]
       self.action = self.argv[1].lower()
       if self.action not in ['kill','retrieve','submit','solve']:
         self.Usage()
-    else:
-      self.Usage()
-     '''
-
-    if len(self.argv) >= 2:
+    elif len(self.argv) >= 2:
       self.cntrfile = self.argv[1]
       self.action = 'solve'
     else:
@@ -109,7 +850,7 @@ class KestrelGamsClient:
 
   def Usage(self):
     sys.stderr.write("\n--- Kestrel fatal error: usage\n")
-    sys.stderr.write("  gamske_ux.out <cntrfile>\n")
+    sys.stderr.write("  gamske_ux.out [kill|retrieve|submit|solve] <cntrfile>\n")
     sys.exit(1)
 
   def Fatal(self, str):
@@ -137,6 +878,8 @@ class KestrelGamsClient:
     except IOError as e:
       self.Fatal("Could not append to status file %s\n" % self.statfilename)
 
+    self.metrics.setdefault('status','error')
+    self.writeMetrics()
     sys.exit(0)
 
   def getDefaultEmail(self):
@@ -147,6 +890,10 @@ class KestrelGamsClient:
   def parseControlFile(self):
     """
     This function does the following with the cntr file
+    line 3:
+      model statistics: rows, columns, nonzeros, nonlinear nonzeros,
+      discrete variables
+
     line 13:
       extract isAscii, useOptions
 
@@ -211,6 +958,13 @@ class KestrelGamsClient:
 
     self.modeltype = int(lines[1].split()[0])
 
+    # model statistics for routing
+    self.modelStats = {}
+    stats = lines[2].split()
+    for (i,name) in enumerate(['rows','cols','nz','nlnz','discrete']):
+      if i < len(stats) and stats[i].isdigit():
+        self.modelStats[name] = int(stats[i])
+
     #if self.cntver != 41 and self.cntver != 42:
     #  self.Fatal("GAMS 22.x required")
 
@@ -440,6 +1194,8 @@ class KestrelGamsClient:
       self.solverName = solverMap[self.modeltype]
     elif os.access(self.optfilename,os.R_OK):
       optfile = open(self.optfilename,'r')
+      self.serverList = []
+      self.routes = []
       self.writeLog("Reading parameter(s) from \"" + self.optfilename + "\"\n")
       for line in optfile:
         m = re.match(r'neos_user_password[\s=]+(\S+)',line)
@@ -453,16 +1209,19 @@ class KestrelGamsClient:
           value = m.groups()[0]
           if value.lower()=="short":
             self.priority = "short"
+          self.explicitPriority = True
 
         m = re.match(r'kestrel_solver[\s=]+(\S+)',line)
         if m:
           self.solverName = m.groups()[0]
+          self.explicitSolver = True
 
-        m = re.match(r'neos_server[\s=]+(\S+)://(\S+):(\d+)',line)
+        m = re.match(r'neos_server[\s=]+(\S+)',line)
         if m:
-          self.serverProtocol = m.groups()[0]
-          self.serverHost = m.groups()[1]
-          self.serverPort = m.groups()[2]
+          # several endpoints may be given, comma separated or on repeated lines
+          for address in m.groups()[0].split(','):
+            if address:
+              self.serverList.append(self.parseServerAddress(address))
 
         m = re.match(r'neos_username[\s=]+(\S+)',line)
         if m:
@@ -472,20 +1231,94 @@ class KestrelGamsClient:
         if m:
           self.authUserPassword = m.groups()[0]
 
-        elif re.match(r'neos_server[\s=]+(\S+)://(\S+)',line):
-          m = re.match(r'neos_server[\s=]+(\S+)://(\S+)',line)
-          self.serverProtocol = m.groups()[0]
-          self.serverHost = m.groups()[1]
+        m = re.match(r'kestrel_cache[\s=]+(\d+)',line)
+        if m:
+          self.useCache = int(m.groups()[0]) != 0
 
-        elif re.match(r'neos_server[\s=]+(\S+):(\d+)',line):
-          m = re.match(r'neos_server[\s=]+(\S+):(\d+)',line)
-          self.serverHost = m.groups()[0]
-          self.serverPort = m.groups()[1]
+        m = re.match(r'kestrel_cache_dir[\s=]+(.+)',line)
+        if m:
+          self.cacheDir = m.groups()[0].strip()
 
-        else:
-          m = re.match(r'neos_server[\s=]+(\S+)',line)
-          if m:
-            self.serverHost = m.groups()[0]
+        m = re.match(r'kestrel_cache_size[\s=]+(\d+)',line)
+        if m:
+          self.cacheSize = int(m.groups()[0])
+
+        m = re.match(r'kestrel_warmstart[\s=]+(\d+)',line)
+        if m:
+          self.warmStart = int(m.groups()[0]) != 0
+
+        m = re.match(r'kestrel_warmstart_file[\s=]+(.+)',line)
+        if m:
+          self.warmStartFile = m.groups()[0].strip()
+
+        m = re.match(r'kestrel_rate[\s=]+(\d*\.?\d+)',line)
+        if m:
+          self.requestRate = float(m.groups()[0])
+
+        m = re.match(r'kestrel_burst[\s=]+(\d+)',line)
+        if m:
+          self.requestBurst = int(m.groups()[0])
+
+        m = re.match(r'kestrel_max_jobs[\s=]+(\d+)',line)
+        if m:
+          self.maxJobs = int(m.groups()[0])
+
+        m = re.match(r'kestrel_sched_dir[\s=]+(.+)',line)
+        if m:
+          self.schedDir = m.groups()[0].strip()
+
+        m = re.match(r'kestrel_scenario_stream[\s=]+(\d+)',line)
+        if m:
+          self.scenarioStream = int(m.groups()[0]) != 0
+
+        m = re.match(r'kestrel_progress_interval[\s=]+(\d*\.?\d+)',line)
+        if m:
+          self.progressInterval = float(m.groups()[0])
+
+        m = re.match(r'kestrel_max_upload_rate[\s=]+(\d*\.?\d+)',line)
+        if m:
+          # in KB/s, 1 KB = 1024 bytes
+          self.maxUploadRate = float(m.groups()[0])
+
+        m = re.match(r'kestrel_routing[\s=]+(\d+)',line)
+        if m:
+          self.routing = int(m.groups()[0]) != 0
+
+        m = re.match(r'kestrel_route[\s=]+(.+)',line)
+        if m:
+          self.routes.append(m.groups()[0].strip())
+
+        m = re.match(r'kestrel_deadline[\s=]+(\d+)',line)
+        if m:
+          self.deadline = int(m.groups()[0])
+
+        m = re.match(r'kestrel_interrupt[\s=]+(kill|detach|ask)',line,re.IGNORECASE)
+        if m:
+          self.interruptAction = m.groups()[0].lower()
+
+        m = re.match(r'kestrel_kill[\s=]+(\d+)',line)
+        if m and int(m.groups()[0]) != 0:
+          self.action = 'kill'
+
+        m = re.match(r'kestrel_metrics_file[\s=]+(.+)',line)
+        if m:
+          self.metricsFile = m.groups()[0].strip()
+
+        m = re.match(r'kestrel_prometheus_file[\s=]+(.+)',line)
+        if m:
+          self.prometheusFile = m.groups()[0].strip()
+
+        m = re.match(r'kestrel_retries[\s=]+(\d+)',line)
+        if m:
+          self.maxRetries = int(m.groups()[0])
+
+        m = re.match(r'kestrel_retry_delay[\s=]+(\d*\.?\d+)',line)
+        if m:
+          self.retryDelay = float(m.groups()[0])
+
+        m = re.match(r'kestrel_hedge_delay[\s=]+(\d*\.?\d+)',line)
+        if m:
+          self.hedgeDelay = float(m.groups()[0])
 
         m = re.match(r'kestrel_(job|jobnumber|jobNumber)[\s=]+(\d+)', line)
         if m:
@@ -501,34 +1334,86 @@ class KestrelGamsClient:
           socket.setdefaulttimeout(float(self.socket_timeout))
 
       optfile.close()
+      if self.serverList:
+        (self.serverProtocol,self.serverHost,self.serverPort) = self.serverList[0]
       self.writeLog("\nFinished reading from \"" + self.optfilename + "\"\n")
     else:
+      self.obtainSolvers()
       raise KestrelSolverException("Could not read options file %s\n" % self.optfilename,self.kestrelGamsSolvers)
 
+  def openScheduler(self):
+    """
+    The scheduler shared with other clients of the same account, if any of
+    kestrel_rate or kestrel_max_jobs is set
+    """
+    if self.scheduler is None and (self.requestRate > 0 or self.maxJobs > 0):
+      directory = self.schedDir or os.path.join(self.cacheDirectory(),'sched')
+      account = self.authUsername or "anonymous"
+      self.scheduler = KestrelScheduler(directory,account,self.requestRate,self.requestBurst,self.maxJobs)
+    return self.scheduler
+
+  def parseServerAddress(self,address):
+    """
+    Splits a neos_server value of the form [<protocol>://]<host>[:<port>]
+    """
+    protocol = "https"
+    port = 3333
+    m = re.match(r'(\S+)://(\S+)',address)
+    if m:
+      protocol = m.groups()[0]
+      address = m.groups()[1]
+    m = re.match(r'(\S+):(\d+)$',address)
+    if m:
+      address = m.groups()[0]
+      port = int(m.groups()[1])
+    return (protocol,address,port)
+
+  @classmethod
+  def openSSLContext(cls):
+    """
+    The SSL context of all connections; loading the CA certificates is
+    costly, so it is only done once per process (or daemon)
+    """
+    if cls.sslContext is None:
+      ssl_context = ssl.create_default_context()
+      if ssl_context.minimum_version < ssl.TLSVersion.TLSv1_2:
+          ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+      if sys.platform == "win32":
+        ssl_context.load_verify_locations(certifi.where())
+      KestrelGamsClient.sslContext = ssl_context
+    return cls.sslContext
+
   def connectServer(self):
-    if self.logopt in [1,3,4]:
-      sys.stdout.write("Connecting to: %s://%s:%s\n" % (self.serverProtocol,self.serverHost,self.serverPort))
-    if self.logopt in [2,4]:
-      # Append the message to the logfile indicated
-      try:
-        f = open(kestrel.logfilename,'a')
-        f.write("Connecting to: %s://%s:%s\n" % (self.serverProtocol,self.serverHost,self.serverPort))
-        f.close()
-      except IOError as e:
-        self.Fatal("Could not append to log file %s" % self.logfilename)
-    ssl_context = ssl.create_default_context()
-    if ssl_context.minimum_version < ssl.TLSVersion.TLSv1_2:
-        ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
-    if sys.platform == "win32":
-      ssl_context.load_verify_locations(certifi.where())
-    self.neos = xmlrpc.client.Server("%s://%s:%s" % (self.serverProtocol,self.serverHost,self.serverPort), context=ssl_context)
-
-    reply = self.neos.ping()
-    if reply.find('alive') < 0:
-      raise KestrelException("Unable to contact NEOS at https://%s:%d" % \
-            (self.host, self.port))
+    self.openSSLContext()
+
+    servers = self.serverList or [(self.serverProtocol,self.serverHost,self.serverPort)]
+    endpoints = [KestrelEndpoint(protocol,host,port,self.sslContext,self.writeLog,
+                                 self.progressInterval,self.maxUploadRate*1024)
+                 for (protocol,host,port) in servers]
+    scheduler = self.openScheduler()
+    self.neos = KestrelServerPool(endpoints,self.hedgeDelay,self.writeLog,
+                                  scheduler.throttle if scheduler else None)
+    (self.neos.maxRetries,self.neos.retryDelay) = (self.maxRetries,self.retryDelay)
+    self.catalogKey = " ".join([endpoint.url for endpoint in endpoints])
+    entry = self.catalog.get(self.catalogKey)
+    if entry and time.time() - entry['time'] < self.catalogTimeout:
+      self.neos.assume(entry['alive'])
+    else:
+      self.neos.connect()
+
+    # Job URLs refer to the endpoint that answered first
+    active = self.neos.endpoints[0]
+    (self.serverProtocol,self.serverHost,self.serverPort) = (active.protocol,active.host,active.port)
 
   def obtainSolvers(self):
+    if self.neos is None:
+      self.connectServer()
+
+    entry = self.catalog.get(self.catalogKey)
+    if entry and time.time() - entry['time'] < self.catalogTimeout:
+      self.kestrelGamsSolvers = entry['solvers']
+      return
+
     # Form a list of all kestrel-gams solver available on NEOS
     allKestrelSolvers = self.neos.listSolversInCategory("kestrel")
     self.kestrelGamsSolvers = []
@@ -537,6 +1422,66 @@ class KestrelGamsClient:
       if i > 0:
         self.kestrelGamsSolvers.append(s[0:i])
 
+    self.catalog[self.catalogKey] = {
+      'time': time.time(),
+      'alive': [endpoint.url for endpoint in self.neos.endpoints[:self.neos.healthy]],
+      'solvers': self.kestrelGamsSolvers }
+
+  def routeModel(self):
+    """
+    Picks queue priority and solver from the first rule whose conditions all
+    hold for the model statistics.  A rule reads
+      <condition>[,<condition>...] <priority>|- [<solver>]
+    with conditions like nz<=50000 or modeltype=lp.  Options given
+    explicitly with kestrel_priority and kestrel_solver take precedence.
+    """
+    rules = self.routes or (defaultRoutes if self.routing else [])
+    if not rules:
+      return
+    stats = dict(self.modelStats)
+    if self.modeltype < len(modelTypes):
+      stats['modeltype'] = modelTypes[self.modeltype]
+    described = "model type %s, %s" % (stats.get('modeltype','?'),
+                ", ".join(["%s %d" % (name,stats[name]) for name in routeStats if name in stats]))
+
+    for (n,rule) in enumerate(rules):
+      fields = rule.split()
+      if len(fields) < 2 or len(fields) > 3:
+        raise KestrelException("Invalid kestrel_route '%s'" % rule)
+      matched = True
+      for condition in fields[0].split(','):
+        m = re.match(r'(\w+)(<=|>=|<|>|=)(\w+)$',condition)
+        if not m:
+          raise KestrelException("Invalid condition '%s' in kestrel_route '%s'" % (condition,rule))
+        (name,op,value) = m.groups()
+        if name not in ['modeltype']+routeStats:
+          raise KestrelException("Unknown model statistic '%s' in kestrel_route '%s'; use modeltype, %s" % \
+                                 (name,rule,", ".join(routeStats)))
+        if name != 'modeltype' and not value.isdigit():
+          raise KestrelException("Invalid number '%s' in kestrel_route '%s'" % (value,rule))
+        if name not in stats:
+          matched = False
+        elif name == 'modeltype':
+          matched = op == '=' and stats[name] == value.lower()
+        else:
+          limit = int(value)
+          matched = {'<': stats[name] < limit, '<=': stats[name] <= limit,
+                     '>': stats[name] > limit, '>=': stats[name] >= limit,
+                     '=': stats[name] == limit}[op]
+        if not matched:
+          break
+      if not matched:
+        continue
+
+      if fields[1] in ['short','long'] and not self.explicitPriority:
+        self.priority = fields[1]
+      if len(fields) == 3 and not self.explicitSolver:
+        self.solverName = fields[2]
+      self.writeLog("Route: priority %s, solver %s (rule %d '%s'; %s)\n" % \
+                    (self.priority,self.solverName,n+1,rule,described))
+      return
+    self.writeLog("Route: no rule matched (%s)\n" % described)
+
   def checkOptionsFile(self):
     if self.solverName and (self.solverName.lower() not in [s.lower() for s in self.kestrelGamsSolvers]):
       errmsg = "Solver '%s' not available on NEOS.\n" % self.solverName
@@ -544,55 +1489,36 @@ class KestrelGamsClient:
 
   def formSubmission(self):
     if not self.solverName:
+      self.obtainSolvers()
       raise KestrelSolverException("No 'kestrel_solver' option found in option file\n",self.kestrelGamsSolvers)
 
+    # Everything that determines the result goes into the fingerprint
+    self.fingerprint = hashlib.sha256()
+    self.addFingerprint('solver',self.solverName.lower().encode())
+
     # Get the matrix, dictionary and instruction file
     gamsFiles = {}
     gamsFiles['cntr'] = io.BytesIO(self.cntr.encode())
+    self.addFingerprint('cntr',self.cntr.encode())
 
     # Need to read empinfo.dat or empinfo.scr
     empInfoFileName = os.path.join(self.scrdir, "empinfo." + self.scrext)
     if os.access(empInfoFileName,os.R_OK):
-      gamsFiles['empinfo'] = io.BytesIO()
-      f = open(empInfoFileName,"rb")
-      zipper = gzip.GzipFile(mode='wb',fileobj=gamsFiles['empinfo'])
-      zipper.write(f.read())
-      zipper.close()
-      f.close()
+      self.compressFile(gamsFiles,'empinfo',empInfoFileName)
 
     # Need to read scenarios
     scenDictName = os.path.join(self.scrdir, "scenario_dict." + self.scrext)
     if os.access(scenDictName,os.R_OK):
-      gamsFiles['scenario'] = io.BytesIO()
-      f = open(scenDictName,"rb")
-      zipper = gzip.GzipFile(mode='wb',fileobj=gamsFiles['scenario'])
-      zipper.write(f.read())
-      zipper.close()
-      f.close()
+      self.compressFile(gamsFiles,'scenario',scenDictName)
 
     if os.access(self.matrfilename,os.R_OK):
-      gamsFiles['matr'] = io.BytesIO()
-      f = open(self.matrfilename,"rb")
-      zipper = gzip.GzipFile(mode='wb',fileobj=gamsFiles['matr'])
-      zipper.write(f.read())
-      zipper.close()
-      f.close()
+      self.compressFile(gamsFiles,'matr',self.matrfilename)
 
     if os.access(self.instfilename,os.R_OK):
-      gamsFiles['inst'] = io.BytesIO()
-      f = open(self.instfilename,"rb")
-      zipper = gzip.GzipFile(mode='wb',fileobj=gamsFiles['inst'])
-      zipper.write(f.read())
-      zipper.close()
-      f.close()
+      self.compressFile(gamsFiles,'inst',self.instfilename)
 
     if os.access(self.dictfilename,os.R_OK):
-      gamsFiles['dict'] = io.BytesIO()
-      f = open(self.dictfilename,"rb")
-      zipper = gzip.GzipFile(mode='wb',fileobj=gamsFiles['dict'])
-      zipper.write(f.read())
-      zipper.close()
-      f.close()
+      self.compressFile(gamsFiles,'dict',self.dictfilename)
 
     if self.isMPSGE != 0 and self.modeltype == 5 and os.access(os.path.join(self.scrdir,'gedata.' + self.scrext),os.R_OK): # MCP might be an MPSGE model
       gamsFiles['cge'] = io.BytesIO()
@@ -609,71 +1535,304 @@ class KestrelGamsClient:
         orgStr = s[start+1:end]
         replStr = b"./gamsdict.scr" + b" "*(len(orgStr) - len("./gamsdict.scr"))
         s = s.replace(orgStr, replStr)
+      self.addFingerprint('cge',s)
       zipper.write(s)
       zipper.close()
       f.close()
 
-    self.xml = """
+    warmStart = self.readWarmStart()
+    if warmStart:
+      gamsFiles['warmstart'] = io.BytesIO()
+      zipper = gzip.GzipFile(mode='wb',fileobj=gamsFiles['warmstart'])
+      self.addFingerprint('warmstart',warmStart)
+      zipper.write(warmStart)
+      zipper.close()
+
+    doc = KestrelDocumentWriter()
+    doc.write("""
       <document>
       <category>kestrel</category>
       <solver>%s</solver>
       <inputType>GAMS</inputType>
       <priority>%s</priority>
-      """ % (self.solverName,self.priority)
+      """ % (self.solverName,self.priority))
 
     for key in list(gamsFiles.keys()):
-      self.xml += "<%s><base64>%s</base64></%s>\n" % (key,base64.b64encode(gamsFiles[key].getvalue()).decode(),key)
+      count = doc.writeBase64(key,gamsFiles[key])
+      if key in ['empinfo','scenario','matr','inst','dict']:
+        self.metrics['compressed_bytes'] = self.metrics.get('compressed_bytes',0) + count
       gamsFiles[key].close()
 
     # Remove 'kestrel', 'neos' and 'socket_timeout' options from options file; they are not needed
     email = None
     xpressemail = None
     runningtime = None
-    self.xml += "<options><![CDATA["
+    doc.write("<options><![CDATA[")
     if self.useOptions:
       with open(self.optfilename) as fp:
-        for line in fp.readlines():
+        for line in fp:
           if not re.match(r'kestrel|neos_server|neos_username|neos_user_password|email|xpressemail|runtime|socket_timeout',line):
-            self.xml += line
+            doc.writeCData(line)
+            self.addFingerprint('option',line.encode())
           elif re.match(r'email',line):
             email = line.rsplit()[1]
           elif re.match(r'xpressemail',line):
             xpressemail = line.rsplit()[1]
           elif re.match(r'runtime',line):
             runningtime = line.rsplit()[1]
-    self.xml += "]]></options>\n"
+    doc.write("]]></options>\n")
 
     if not email:
       email = self.getDefaultEmail()
     if not email:
       self.Error("No email address provided. Either specify it in an option file or set environment variable NEOS_EMAIL (e.g. via gamsconfig.yaml).")
-    self.xml += "<email>"
-    self.xml += email
-    self.xml += "</email>\n"
+    doc.write("<email>%s</email>\n" % email)
 
     if xpressemail:
-      self.xml += "<xpressemail>"
-      self.xml += xpressemail
-      self.xml += "</xpressemail>\n"
+      doc.write("<xpressemail>%s</xpressemail>\n" % xpressemail)
+
+    # Ask for scenario results in the intermediate output as they finish
+    if self.scenarioStream and 'scenario' in gamsFiles:
+      doc.write("<scenariostream>1</scenariostream>\n")
 
     if runningtime:
-      self.xml += "<priority>"
-      self.xml += runningtime
-      self.xml += "</priority>"
+      doc.write("<priority>%s</priority>" % runningtime)
+
+    doc.write("</document>")
+    self.document = doc
+    self.metrics['upload_bytes'] = len(doc)
 
-    self.xml += "</document>"
+    if self.useCache:
+      self.cacheKey = self.fingerprint.hexdigest()
+
+  def compressFile(self,gamsFiles,key,fname):
+    """
+    Gzips fname into a spool file gamsFiles[key] and adds it to the
+    fingerprint, reading it in chunks so that large files are never held in
+    memory
+    """
+    gamsFiles[key] = tempfile.SpooledTemporaryFile(max_size=KestrelDocumentWriter.spoolSize)
+    self.fingerprint.update(("%s %d\n" % (key,os.path.getsize(fname))).encode())
+    with open(fname,"rb") as f:
+      zipper = gzip.GzipFile(mode='wb',fileobj=gamsFiles[key])
+      for chunk in iter(lambda: f.read(KestrelDocumentWriter.chunkSize), b""):
+        self.fingerprint.update(chunk)
+        zipper.write(chunk)
+        self.metrics['raw_bytes'] = self.metrics.get('raw_bytes',0) + len(chunk)
+      zipper.close()
+
+  def addFingerprint(self,key,data):
+    self.fingerprint.update(("%s %d\n" % (key,len(data))).encode())
+    self.fingerprint.update(data)
+
+  def cacheDirectory(self):
+    if self.cacheDir:
+      return self.cacheDir
+    if sys.platform == "win32" and 'LOCALAPPDATA' in os.environ:
+      return os.path.join(os.environ['LOCALAPPDATA'],'kestrel')
+    return os.path.join(os.environ.get('XDG_CACHE_HOME',os.path.join(os.path.expanduser('~'),'.cache')),'kestrel')
+
+  def openCache(self):
+    return KestrelResultCache(self.cacheDirectory(),self.cacheSize*1024*1024)
+
+  def warmStartFileName(self):
+    """
+    Location of the last solution of this model.  A model is identified by
+    its type and dictionary, so data changes between solves (rolling horizon,
+    scenario loops) still find the previous point.
+    """
+    key = hashlib.sha256(("%d\n" % self.modeltype).encode())
+    try:
+      with open(self.dictfilename,'rb') as f:
+        key.update(f.read())
+    except IOError:
+      key.update(self.scrdir.encode())
+    return os.path.join(self.cacheDirectory(),'warmstart',key.hexdigest() + '.solu')
+
+  def readWarmStart(self):
+    """
+    Returns the starting point to ship with the submission as <warmstart>,
+    if any: a user provided solution or MIP start file, or the last solution
+    of the model.  Whether the point is used is up to the Kestrel driver on
+    the server.
+    """
+    fname = self.warmStartFile
+    if not fname:
+      if not self.warmStart:
+        return None
+      fname = self.warmStartFileName()
+      if not os.access(fname,os.R_OK):
+        self.writeLog("Warm start: no previous solution for this model\n")
+        return None
+    try:
+      with open(fname,'rb') as f:
+        data = f.read()
+    except IOError as e:
+      self.Error("Could not read warm start file %s\n" % fname)
+    self.writeLog("Warm start: attaching %d bytes from %s\n" % (len(data),fname))
+    self.warmStartSize = len(data)
+    return data
+
+  def saveWarmStart(self):
+    """
+    Keeps the solution as the starting point of the next solve of the model,
+    unless the solve failed to produce a point
+    """
+    if not self.warmStart:
+      return
+    try:
+      modelStatus = int(float(self.readSolutionHeader()[1]))
+    except (IOError, KeyError, ValueError):
+      return
+    if modelStatus not in self.solvedModelStatus:
+      return
+    fname = self.warmStartFileName()
+    try:
+      os.makedirs(os.path.dirname(fname),exist_ok=True)
+      with open(self.solufilename,'rb') as f:
+        data = f.read()
+      with open(fname + ".%d.tmp" % os.getpid(),'wb') as f:
+        f.write(data)
+      os.replace(fname + ".%d.tmp" % os.getpid(),fname)
+    except OSError as e:
+      self.writeLog("\nWarning: could not save warm start point: %s\n" % e)
+
+  def readSolutionHeader(self):
+    """
+    Returns the numbered header records of the solution file as strings
+    """
+    header = {}
+    with open(self.solufilename,'r') as f:
+      for line in f:
+        m = re.match(r'\s*(\d+)\s+(\S+)',line)
+        if not m or m.groups()[0] == '0':
+          break
+        header[int(m.groups()[0])] = m.groups()[1]
+    return header
+
+  def logSolveStatistics(self):
+    """
+    Reports iterations and resource usage from the solution file header
+    (record 3: iterations used, record 4: resource used) next to the wall
+    clock time since submission.
+    """
+    try:
+      header = self.readSolutionHeader()
+      iterations = int(float(header[3]))
+      resused = float(header[4])
+    except (IOError, KeyError, ValueError):
+      return
+    self.metrics['iterations'] = iterations
+    self.metrics['resource_used'] = resused
+    msg = "\nSolve statistics: %d iteration(s), %.2f s resource usage" % (iterations,resused)
+    if self.submitTime:
+      msg += ", %.2f s wall clock" % (time.time()-self.submitTime)
+    if self.warmStartSize:
+      msg += " (starting point attached)"
+    self.writeLog(msg + "\n")
+
+  def loadCachedResults(self):
+    """
+    Reproduces the output files from the result cache; returns False on a miss
+    """
+    if not self.cacheKey:
+      return False
+    resultsXML = self.openCache().lookup(self.cacheKey)
+    if resultsXML is None:
+      return False
+    self.writeLog("\nReusing cached NEOS results (%s)\n\n" % self.cacheKey[:16])
+    # The submission is not needed anymore; its spool file may be on disk
+    self.document.close()
+    self.parseSolution(resultsXML)
+    self.saveWarmStart()
+    self.metrics['status'] = "cached"
+    self.metrics.pop('upload_bytes',None)
+    return True
+
+  def storeCachedResults(self,resultsXML):
+    if not self.cacheKey:
+      return
+    if isinstance(resultsXML,str):
+      resultsXML = resultsXML.encode()
+    # Only complete results are worth reusing
+    if resultsXML.find(b'<solu>') < 0 or resultsXML.find(b'<stat>') < 0:
+      return
+    # ... and only normal completions (record 1: model status, record 2:
+    # solver status).  Errors, interrupts and resource limits may well turn
+    # out differently on the next attempt.
+    try:
+      header = self.readSolutionHeader()
+      modelStatus = int(float(header[1]))
+      solverStatus = int(float(header[2]))
+    except (IOError, KeyError, ValueError):
+      return
+    if solverStatus != 1 or modelStatus not in self.solvedModelStatus:
+      return
+    try:
+      self.openCache().store(self.cacheKey,resultsXML)
+    except OSError as e:
+      self.writeLog("\nWarning: could not write result cache: %s\n" % e)
+
+  def submitOnce(self,method,args):
+    """
+    Submits the job, resubmitting after a failure only if the NEOS queue
+    shows that the lost submission did not create a job.
+
+    printQueue only lists jobs that are still queued or running, so a job
+    that already finished before the check is not found and runs a second
+    time.  The queue is checked right after the failure, before backing
+    off, which leaves only jobs that finish within one round trip.
+    """
+    attempt = 0
+    while True:
+      try:
+        return self.neos.call(method,args)
+      except transportErrors as e:
+        error = e
+      attempt += 1
+      if attempt > self.maxRetries:
+        raise KestrelException("Submission to NEOS failed: %s" % error)
+      if method != 'submitJob':
+        # Authenticated jobs do not carry our token, so we cannot tell
+        raise KestrelException("Submission to NEOS failed: %s\nThe job may have been queued; check your NEOS account before resubmitting" % error)
+      try:
+        queued = self.neos.printQueue().find(self.submitToken) >= 0
+      except (transportErrors + (xmlrpc.client.Fault,)) as e:
+        raise KestrelException("Submission to NEOS failed: %s\nCould not check whether the job was queued: %s" % (error,e))
+      if queued:
+        raise KestrelException("The reply to the submission was lost, but NEOS queued the job (%s); not resubmitting" % self.submitToken)
+      delay = backoffDelay(attempt,self.retryDelay)
+      self.writeLog("\nSubmission failed (%s) and NEOS has no job from it; resubmitting in %.1f s\n" % (error,delay))
+      self.neos.retries += 1
+      time.sleep(delay)
+
+  def releaseSlot(self):
+    if self.scheduler:
+      self.scheduler.releaseSlot()
 
   def submit(self):
-    user = "%s on %s" % (os.getenv('LOGNAME'),
-                         socket.getfqdn(socket.gethostname()))
-    if self.authUsername is None or self.authUserPassword is None:
-      if self.authUsername: self.writeLog("\nWarning: 'neos_username' was specified, but not 'neos_user_password'")
-      if self.authUserPassword: self.writeLog("\nWarning: 'neos_user_password' was specified, but not 'neos_username'")
-      (self.jobNumber,self.password) = \
-                       self.neos.submitJob(self.xml,user,"kestrel")
-    else:
-      (self.jobNumber,self.password) = \
-                       self.neos.authenticatedSubmitJob(self.xml,self.authUsername,self.authUserPassword,"kestrel")
+    scheduler = self.openScheduler()
+    if scheduler and self.maxJobs > 0:
+      (wait,ahead) = scheduler.acquireSlot(self.priority)
+      self.metrics['local_queue_wait'] = round(wait,3)
+      self.writeLog("Local submission queue: waited %.1f s for a job slot (priority %s, %d ahead)\n" % \
+                    (wait,self.priority,ahead))
+    self.submitTime = time.time()
+    # The token lets us find the job in the NEOS queue if the reply is lost
+    self.submitToken = "kestrel-%s" % base64.b32encode(os.urandom(10)).decode().lower()
+    user = "%s on %s [%s]" % (os.getenv('LOGNAME'),
+                              socket.getfqdn(socket.gethostname()),self.submitToken)
+    try:
+      if self.authUsername is None or self.authUserPassword is None:
+        if self.authUsername: self.writeLog("\nWarning: 'neos_username' was specified, but not 'neos_user_password'")
+        if self.authUserPassword: self.writeLog("\nWarning: 'neos_user_password' was specified, but not 'neos_username'")
+        (self.jobNumber,self.password) = \
+                         self.submitOnce('submitJob',(self.document,user,"kestrel"))
+      else:
+        (self.jobNumber,self.password) = \
+                         self.submitOnce('authenticatedSubmitJob',(self.document,self.authUsername,self.authUserPassword,"kestrel"))
+    finally:
+      self.document.close()
     if self.jobNumber==0:
       raise KestrelException(self.password)
 
@@ -705,6 +1864,81 @@ class KestrelGamsClient:
     except IOError as e:
       self.Error("Could not append to status file %s\n" % self.statfilename)
 
+  def writeMetrics(self):
+    """
+    Appends the record of this job to the JSON lines metrics file and adds it
+    to the counters in the Prometheus textfile, once per run
+    """
+    if self.metrics.get('written') or not (self.metricsFile or self.prometheusFile):
+      return
+    self.metrics['written'] = True
+    record = {'time': round(time.time(),3),
+              'job': self.jobNumber,
+              'solver': self.solverName,
+              'modeltype': modelTypes[self.modeltype] if 0 < getattr(self,'modeltype',0) < len(modelTypes) else None,
+              'priority': self.priority,
+              'status': self.metrics.get('status','done')}
+    for key in ['upload_bytes','download_bytes','raw_bytes','compressed_bytes','local_queue_wait',
+                'queue_wait','run_time','polls','iterations','resource_used']:
+      if key in self.metrics:
+        record[key] = self.metrics[key]
+    if self.metrics.get('compressed_bytes'):
+      record['compression_ratio'] = round(float(self.metrics.get('raw_bytes',0))/self.metrics['compressed_bytes'],3)
+    if self.neos is not None:
+      record['retries'] = self.neos.retries
+      record['hedges'] = self.neos.hedges
+
+    try:
+      if self.metricsFile:
+        with open(self.metricsFile,'a') as f:
+          f.write(json.dumps(record) + "\n")
+      if self.prometheusFile:
+        self.writePrometheus(record)
+    except (IOError, OSError) as e:
+      self.writeLog("\nWarning: could not write metrics: %s\n" % e)
+
+  def writePrometheus(self,record):
+    """
+    The counters of all runs are kept in <file>.json next to the textfile
+    collector output, which is replaced atomically
+    """
+    labels = 'solver="%s",status="%s"' % (prometheusLabel(record['solver'] or ""),
+                                          prometheusLabel(record['status']))
+    def add(state):
+      for (name,value) in [('kestrel_jobs_total',1),
+                           ('kestrel_polls_total',record.get('polls',0)),
+                           ('kestrel_retries_total',record.get('retries',0)),
+                           ('kestrel_upload_bytes_total',record.get('upload_bytes',0)),
+                           ('kestrel_download_bytes_total',record.get('download_bytes',0))]:
+        series = "%s{%s}" % (name,labels)
+        state[series] = state.get(series,0) + value
+      # Durations are summaries; only jobs that got that far are counted
+      for (name,key) in [('kestrel_queue_wait_seconds','queue_wait'),('kestrel_run_seconds','run_time')]:
+        if key in record:
+          for (suffix,value) in [('_sum',record[key]),('_count',1)]:
+            series = "%s%s{%s}" % (name,suffix,labels)
+            state[series] = state.get(series,0) + value
+      state['kestrel_last_job_timestamp_seconds'] = record['time']
+      return dict(state)
+
+    counters = updateLocked(self.prometheusFile + ".json",add)
+    tmpname = "%s.%d.tmp" % (self.prometheusFile,os.getpid())
+    with open(tmpname,'w') as f:
+      typed = set()
+      for series in sorted(counters):
+        name = series.split('{')[0]
+        if name.endswith("_timestamp_seconds"):
+          metricType = "gauge"
+        elif name.endswith("_seconds_sum") or name.endswith("_seconds_count"):
+          (name,metricType) = (name.rsplit('_',1)[0],"summary")
+        else:
+          metricType = "counter"
+        if name not in typed:
+          f.write("# TYPE %s %s\n" % (name,metricType))
+          typed.add(name)
+        f.write("%s %s\n" % (series,counters[series]))
+    os.replace(tmpname,self.prometheusFile)
+
   def getText(self,node):
     """
     Returns the text from the node of an xml document
@@ -765,60 +1999,194 @@ class KestrelGamsClient:
 
     doc.unlink()
 
+  scenarioMarker = "@@scenrep "
+
+  def extractScenarioResults(self,results):
+    """
+    Removes the scenario result lines from the intermediate output and
+    appends their data to the local scenrep file.  A line has the form
+      @@scenrep <finished> <total> <hex data>
+    Lines cut off at the end of a chunk are kept until the next poll.
+    Corrupt lines are passed on to the output.  The complete file returned
+    with the final results replaces the streamed one.
+    """
+    text = self.streamBuffer + results
+    self.streamBuffer = ""
+    output = []
+    for line in text.splitlines(True):
+      if line.startswith(self.scenarioMarker) or \
+         (not line.endswith("\n") and self.scenarioMarker.startswith(line)):
+        if not line.endswith("\n"):
+          self.streamBuffer = line
+          continue
+        fields = line.split()
+        try:
+          (finished,total,data) = (int(fields[1]),int(fields[2]),bytes.fromhex(fields[3]))
+        except (IndexError, ValueError):
+          output.append("\nWarning: corrupt scenario result line\n" + line)
+          continue
+        fname = os.path.join(self.scrdir, "scenrep.%s" % self.scrext)
+        try:
+          f = open(fname, 'ab' if self.scenariosReceived else 'wb')
+          f.write(data)
+          f.close()
+        except IOError as e:
+          self.Error("Could not write file scenrep.%s\n" % self.scrext)
+        self.scenariosReceived = finished
+        output.append("Scenario results: %d/%d received\n" % (finished,total))
+      else:
+        output.append(line)
+    return "".join(output)
+
+  def connectionLost(self,error):
+    """
+    Gives up after the retries were exhausted; the job itself may be fine
+    """
+    msg = "Lost connection to NEOS: %s\n" % error
+    if self.jobNumber and self.password:
+      msg += '''Job may still be running on remote machine\n\
+To retrieve results, run GAMS using solver 'kestrel' with option file:\n\
+kestrel_job %d\n\
+kestrel_pass %s\n''' % (self.jobNumber, self.password)
+    self.Error(msg)
+
+  def terminate(self,signum,frame):
+    raise KestrelInterrupt("Terminated")
+
+  def askInterruptAction(self):
+    # Without a terminal to ask, leave the job running
+    try:
+      if not sys.stdin.isatty():
+        return "detach"
+      sys.stdout.write("\nKill NEOS job#=%d? [y/N] " % self.jobNumber)
+      sys.stdout.flush()
+      answer = sys.stdin.readline()
+    except (OSError, KeyboardInterrupt):
+      return "detach"
+    return "kill" if answer.strip().lower() in ['y','yes'] else "detach"
+
+  def cancelJob(self,reason,action):
+    """
+    Stops waiting for the job: either kills it on NEOS and marks the solve as
+    failed, or leaves it running and tells how to pick up the results later.
+    Does not return.
+    """
+    if action == "ask":
+      action = self.askInterruptAction()
+
+    # Do not get interrupted again while cleaning up; the handlers are
+    # restored on the way out for callers that carry on (daemon, tests)
+    handlers = [(signum,signal.signal(signum,signal.SIG_IGN)) for signum in [signal.SIGINT,signal.SIGTERM]]
+    try:
+      self.metrics['status'] = "killed" if action == "kill" else "detached"
+      if action == "kill":
+        try:
+          response = self.neos.killJob(self.jobNumber,self.password)
+        except (transportErrors + (xmlrpc.client.Fault,)) as e:
+          response = "Could not kill job: %s" % e
+        self.writeErrorOutputFiles()
+        msg = '''%s\n\
+NEOS job#=%d was stopped on the remote machine\n\
+%s\n''' % (reason, self.jobNumber, response)
+      else:
+        msg = '''%s\n\
+Job is still running on remote machine\n\
+To retrieve results, run GAMS using solver 'kestrel' with option file:\n\
+kestrel_job %d\n\
+kestrel_pass %s\n\n\
+To stop job, run GAMS using solver 'kestrelkil' with above option file\n\
+''' % (reason, self.jobNumber, self.password)
+      self.Error(msg)
+    finally:
+      for (signum,handler) in handlers:
+        if handler is not None:
+          signal.signal(signum,handler)
+
+  def writeIntermediateResults(self,results):
+    if results and len(results):
+
+      if self.logopt in [1,3,4]:
+        # Send the output to the screen
+        sys.stdout.write(results)
+      if self.logopt in [2,4]:
+        # Append the error message to the logfile indicated
+        try:
+          f = open(self.logfilename,'a')
+          f.write(results)
+          f.close()
+        except IOError as e:
+          self.Error("Could not append to log file %s" % self.logfilename)
+
+      try:
+        f = open(self.statfilename,'a')
+        f.write("=1\n\n")
+        f.write(results)
+        f.write("=2\n")
+        f.close()
+      except IOError as e:
+        self.Error("Could not append to status file %s\n" % self.statfilename)
+
   def getResults(self):
     offset = 0
+    deadline = None
+    if self.deadline:
+      deadline = (self.submitTime or time.time()) + self.deadline
+    previousHandler = signal.signal(signal.SIGTERM,self.terminate)
     status = self.neos.getJobStatus(self.jobNumber,self.password)
+    self.metrics['polls'] = 1
+    waitStart = self.submitTime or time.time()
+    runStart = None
     try:
       while (status == "Waiting" or status=="Running"):
+        if status == "Running" and runStart is None:
+          runStart = time.time()
+          self.metrics['queue_wait'] = round(runStart - waitStart,3)
+        if deadline and time.time() > deadline:
+          self.cancelJob("Deadline of %d s exceeded" % self.deadline,"kill")
         (results,offset) = self.neos.getIntermediateResults(self.jobNumber, self.password,offset)
         if isinstance(results,xmlrpc.client.Binary):
           results = results.data.decode()
-        if results and len(results):
-
-          if self.logopt in [1,3,4]:
-            # Send the output to the screen
-            sys.stdout.write(results)
-          if self.logopt in [2,4]:
-            # Append the error message to the logfile indicated
-            try:
-              f = open(self.logfilename,'a')
-              f.write(results)
-              f.close()
-            except IOError as e:
-              self.Error("Could not append to log file %s" % self.logfilename)
-
-          try:
-            f = open(self.statfilename,'a')
-            f.write("=1\n\n")
-            f.write(results)
-            f.write("=2\n")
-            f.close()
-          except IOError as e:
-            self.Error("Could not append to status file %s\n" % self.statfilename)
+        if results and self.scenarioStream:
+          results = self.extractScenarioResults(results)
+        self.writeIntermediateResults(results)
         status = self.neos.getJobStatus(self.jobNumber,self.password)
-        time.sleep(5)
+        self.metrics['polls'] += 1
+        time.sleep(self.pollInterval)
 
     except KeyboardInterrupt as e:
-      msg = '''Keyboard Interrupt\n\
-Job is still running on remote machine\n\
-To retrieve results, run GAMS using solver 'kestrel' with option file:\n\
-kestrel_job %d\n\
-kestrel_pass %s\n\n\
-To stop job, run GAMS using solver 'kestrelkil' with above option file\n\
-''' % (self.jobNumber, self.password)
-      self.Error(msg)
+      self.cancelJob("Keyboard Interrupt",self.interruptAction)
+    except KestrelInterrupt as e:
+      self.cancelJob(e.msg,self.interruptAction)
+    finally:
+      signal.signal(signal.SIGTERM,previousHandler)
+
+    if self.streamBuffer:
+      # The output ended in the middle of a line that looked like scenario
+      # results; it may still be a complete one
+      self.writeIntermediateResults(self.extractScenarioResults("\n"))
+
+    if runStart is None:
+      self.metrics['queue_wait'] = round(time.time() - waitStart,3)
+    else:
+      self.metrics['run_time'] = round(time.time() - runStart,3)
 
     resultsXML = self.neos.getFinalResults(self.jobNumber,self.password)
     if isinstance(resultsXML,xmlrpc.client.Binary):
       resultsXML = resultsXML.data
+    self.metrics['download_bytes'] = len(resultsXML)
     self.parseSolution(resultsXML)
-
-if __name__=="__main__":
-  #  print 'in gmske_ux.out'
+    self.storeCachedResults(resultsXML)
+    self.saveWarmStart()
+    self.logSolveStatistics()
+    if self.scheduler:
+      if self.scheduler.delayed:
+        self.writeLog("Rate limit: %d request(s) delayed, %.1f s total\n" % \
+                      (self.scheduler.delayed,self.scheduler.throttleWait))
+
+def main(argv):
   # Initialization phase
-
   try:
-    kestrel = KestrelGamsClient(sys.argv)
+    kestrel = KestrelGamsClient(argv)
     kestrel.parseControlFile()
     try:
       f = open(os.path.join(pathlib.Path(__file__).parent.absolute(),'gamsstmp.txt'),'r')
@@ -830,32 +2198,50 @@ if __name__=="__main__":
     kestrel.writeLog('\nFor terms of use please inspect https://neos-server.org/neos/termofuse.html\n\n')
     kestrel.writeErrorOutputFiles()
     kestrel.parseOptionsFile()
-    kestrel.connectServer()
-    kestrel.obtainSolvers()
   except KestrelException as e:
     kestrel.Error(e.msg)
 
   if kestrel.action=="solve":
     # Solve with job number and password retrieves the results
-    # Otherwise we obtain them from the submission
+    # Otherwise we obtain them from the submission or the result cache
 
     try:
       kestrel.parseOptionsFile()
+      if (not kestrel.jobNumber) or (not kestrel.password):
+        kestrel.routeModel()
       kestrel.writeLog("NEOS Solver: %s\n" % kestrel.solverName)
       if (not kestrel.jobNumber) or (not kestrel.password):
-        kestrel.checkOptionsFile()
         kestrel.formSubmission()
-        kestrel.submit()
-      kestrel.getResults()
+        if not kestrel.loadCachedResults():
+          kestrel.obtainSolvers()
+          kestrel.checkOptionsFile()
+          try:
+            kestrel.submit()
+            kestrel.getResults()
+          finally:
+            kestrel.releaseSlot()
+          kestrel.neos.logStats()
+      else:
+        kestrel.obtainSolvers()
+        kestrel.getResults()
+        kestrel.neos.logStats()
+      kestrel.writeMetrics()
     except KestrelException as e:
       kestrel.Error(e.msg)
+    except transportErrors as e:
+      kestrel.connectionLost(e)
 
   elif kestrel.action=="submit":
     try:
       kestrel.parseOptionsFile()
+      kestrel.routeModel()
+      kestrel.obtainSolvers()
       kestrel.checkOptionsFile()
       kestrel.formSubmission()
-      kestrel.submit()
+      try:
+        kestrel.submit()
+      finally:
+        kestrel.releaseSlot()
 
       fname = os.path.join(kestrel.scrdir, "kestrel." + kestrel.scrext)
       try:
@@ -864,6 +2250,8 @@ if __name__=="__main__":
         f.close()
       except IOError as e:
         kestrel.Error("Could not append to submission file %s\n" % fname)
+      kestrel.metrics['status'] = "submitted"
+      kestrel.writeMetrics()
 
     except KestrelException as e:
       kestrel.Error(e.msg)
@@ -885,9 +2273,13 @@ if __name__=="__main__":
 
     if kestrel.jobNumber and kestrel.password:
       try:
+        kestrel.connectServer()
         kestrel.getResults()
+        kestrel.writeMetrics()
       except KestrelException as e:
         kestrel.Error(e.msg)
+      except transportErrors as e:
+        kestrel.connectionLost(e)
     else:
       kestrel.Error( "Corrupt submission file %s\n" % fname)
 
@@ -905,27 +2297,204 @@ if __name__=="__main__":
     # Kill and job retrieval do not require a valid solver
     kestrel.parseOptionsFile()
     if kestrel.jobNumber and kestrel.password:
-      response = kestrel.neos.killJob(kestrel.jobNumber,kestrel.password)
+      try:
+        kestrel.connectServer()
+        response = kestrel.neos.killJob(kestrel.jobNumber,kestrel.password)
+
+        if kestrel.logopt in [1,3,4]:
+          # Send the output to the screen
+          sys.stdout.write("\n%s\n\n" % response)
+        elif (kestrel.logopt == 2):
+          # Append the error message to the logfile indicated
+          try:
+            f = open(kestrel.logfilename,'a')
+            f.write("\n%s\n\n" % response)
+            f.close()
+          except IOError as e:
+            kestrel.Error("Could not append to log file %s" % kestrel.logfilename)
 
-      if kestrel.logopt in [1,3,4]:
-        # Send the output to the screen
-        sys.stdout.write("\n%s\n\n" % response)
-      elif (kestrel.logopt == 2):
-        # Append the error message to the logfile indicated
         try:
-          f = open(kestrel.logfilename,'a')
-          f.write("\n%s\n\n" % response)
+          f = open(kestrel.statfilename,'a')
+          f.write("=1\n\n")
+          f.write("%s\n\n" % response)
+          f.write("=2\n")
           f.close()
         except IOError as e:
-          kestrel.Error("Could not append to log file %s" % kestrel.logfilename)
-
-      try:
-        f = open(kestrel.statfilename,'a')
-        f.write("=1\n\n")
-        f.write("%s\n\n" % response)
-        f.write("=2\n")
-        f.close()
-      except IOError as e:
-        kestrel.Error("Could not append to status file %s\n" % kestrel.statfilename)
+          kestrel.Error("Could not append to status file %s\n" % kestrel.statfilename)
+        kestrel.metrics['status'] = "killed"
+        kestrel.writeMetrics()
+      except KestrelException as e:
+        kestrel.Error(e.msg)
+      except transportErrors as e:
+        kestrel.connectionLost(e)
     else:
       kestrel.Error( "No 'kestrel_job' and 'kestrel_pass' options found in %s\n\n" % kestrel.optfilename)
+
+class KestrelDaemon:
+  """
+  Long lived server that runs solves for gmske_dc.py launchers.
+
+  The launcher connects to the Unix socket at socketPath and sends its
+  environment, working directory and control file name together with its
+  stdout and stderr descriptors as one JSON line.  Every request is run by
+  a forked copy of the daemon, so the imports, the SSL context built at
+  startup and the endpoint health and solver catalog of earlier solves are
+  reused.  Connections are not: every job opens its own.  The exit code of
+  the job is returned to the launcher; a line "INT" or "TERM" from the
+  launcher is passed on to the job as SIGINT or SIGTERM.
+
+  A launcher has requestTimeout seconds to send its request; the daemon
+  serves one connection at a time until then.
+  """
+  requestTimeout = 5
+
+  def __init__(self,socketPath):
+    self.socketPath=socketPath
+    self.jobs={}
+
+  def serve(self):
+    # Inherited by every forked job
+    KestrelGamsClient.openSSLContext()
+    if os.path.exists(self.socketPath):
+      os.unlink(self.socketPath)
+    self.server = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    self.server.bind(self.socketPath)
+    self.server.listen(64)
+
+    # Wake up the select loop whenever a job finishes
+    (self.wakeup,wakeupWrite) = os.pipe()
+    os.set_blocking(wakeupWrite,False)
+    signal.set_wakeup_fd(wakeupWrite)
+    signal.signal(signal.SIGCHLD,lambda signum,frame: None)
+
+    self.selector = selectors.DefaultSelector()
+    self.selector.register(self.server,selectors.EVENT_READ,self.accept)
+    self.selector.register(self.wakeup,selectors.EVENT_READ,self.reap)
+    sys.stdout.write("Kestrel daemon listening on %s\n" % self.socketPath)
+    sys.stdout.flush()
+    try:
+      while True:
+        for (key,events) in self.selector.select():
+          key.data(key.fileobj)
+    except KeyboardInterrupt:
+      pass
+    finally:
+      self.server.close()
+      os.unlink(self.socketPath)
+
+  def accept(self,server):
+    (conn,addr) = server.accept()
+    conn.settimeout(self.requestTimeout)
+    fds = []
+    try:
+      # The descriptors come with the first part of the request line
+      (msg,fds,flags,addr) = socket.recv_fds(conn,65536,2)
+      if len(fds) != 2:
+        raise ValueError("expected 2 descriptors, got %d" % len(fds))
+      while b"\n" not in msg:
+        data = conn.recv(65536)
+        if not data:
+          raise ValueError("incomplete request")
+        msg += data
+      (msg,rest) = msg.split(b"\n",1)
+      request = json.loads(msg.decode())
+    except (OSError, ValueError) as e:
+      for fd in fds:
+        os.close(fd)
+      conn.close()
+      return
+    conn.settimeout(None)
+    (catalogRead,catalogWrite) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+      os.close(catalogRead)
+      self.runJob(request,fds,catalogWrite)
+    os.close(catalogWrite)
+    for fd in fds:
+      os.close(fd)
+    self.jobs[pid] = (conn,catalogRead)
+    self.selector.register(conn,selectors.EVENT_READ,self.forward)
+    if rest:
+      # An interrupt that arrived right behind the request
+      self.signalJob(pid,rest)
+
+  def runJob(self,request,fds,catalogWrite):
+    # In the forked child; never returns
+    self.selector.close()
+    self.server.close()
+    os.close(self.wakeup)
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD,signal.SIG_DFL)
+    os.dup2(fds[0],1)
+    os.dup2(fds[1],2)
+    os.environ.clear()
+    os.environ.update(request['env'])
+    started = time.time()
+    code = 0
+    try:
+      os.chdir(request['cwd'])
+      main(['gmske_nx.py',request['cntr']])
+    except SystemExit as e:
+      code = e.code if isinstance(e.code,int) else 1
+    except BaseException as e:
+      sys.stderr.write("\n--- Kestrel fatal error: %s\n\n" % e)
+      code = 1
+    finally:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      updates = dict([(key,entry) for (key,entry) in KestrelGamsClient.catalog.items() if entry['time'] >= started])
+      os.write(catalogWrite,json.dumps(updates).encode())
+      os._exit(code)
+
+  def forward(self,conn):
+    # Interrupt requests from the launcher
+    try:
+      data = conn.recv(64)
+    except OSError:
+      data = b""
+    for (pid,(jobConn,catalogRead)) in self.jobs.items():
+      if jobConn is conn:
+        if not data:
+          # Launcher went away; nobody is left to interrupt the job
+          self.selector.unregister(conn)
+        else:
+          self.signalJob(pid,data)
+        break
+
+  def signalJob(self,pid,data):
+    if data.startswith(b"INT"):
+      os.kill(pid,signal.SIGINT)
+    elif data.startswith(b"TERM"):
+      os.kill(pid,signal.SIGTERM)
+
+  def reap(self,wakeup):
+    os.read(self.wakeup,512)
+    while self.jobs:
+      try:
+        (pid,status) = os.waitpid(-1,os.WNOHANG)
+      except ChildProcessError:
+        break
+      if pid == 0:
+        break
+      (conn,catalogRead) = self.jobs.pop(pid)
+      with os.fdopen(catalogRead,'rb') as f:
+        try:
+          KestrelGamsClient.catalog.update(json.loads(f.read().decode() or "{}"))
+        except ValueError:
+          pass
+      try:
+        self.selector.unregister(conn)
+      except KeyError:
+        pass
+      try:
+        conn.sendall(b"%d\n" % os.waitstatus_to_exitcode(status))
+      except OSError:
+        pass
+      conn.close()
+
+if __name__=="__main__":
+  #  print 'in gmske_ux.out'
+  if len(sys.argv) >= 3 and sys.argv[1] == "--daemon":
+    KestrelDaemon(sys.argv[2]).serve()
+  else:
+    main(sys.argv)
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+
+import standin
+
+@pytest.fixture
+def neos():
+  servers = []
+  def serve(neos=None,idleTimeout=None):
+    neos = neos or standin.StandinNeos()
+    (server,url) = standin.start(neos,idleTimeout)
+    servers.append(server)
+    return (neos,url)
+  yield serve
+  for server in servers:
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def run(monkeypatch):
+  """
+  Runs the client in-process on a control file; returns the exit code
+  """
+  import gmske_nx
+  monkeypatch.setattr(gmske_nx.KestrelGamsClient,'pollInterval',0.01)
+  def run(*args):
+    try:
+      gmske_nx.main(['gmske_nx.py']+list(args))
+    except SystemExit as e:
+      return e.code
+    return 0
+  return run
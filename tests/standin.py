@@ -0,0 +1,198 @@
+#
+# Local stand-in for the NEOS XML-RPC interface, used by the tests and the
+# benchmarks.  It answers the calls the Kestrel client makes, runs every job
+# for a configurable number of status polls and can inject faults, slow calls
+# and dropped connections per method.
+#
+
+import os
+import sys
+import time
+import threading
+import xmlrpc.client
+import xml.dom.minidom
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+# Solution header records 1-5 of a normal completion followed by the end
+# marker; records 3 and 4 are iterations and resource usage
+SOLUTION = "  1 1.0\n  2 1.0\n  3 42\n  4 0.5\n  5 7.0\n  0 0.0\n"
+
+class StandinNeos:
+  """
+  Job logic of the stand-in.  `polls` status calls per job are answered with
+  "Running", intermediate output is served from `output` one chunk per call.
+  Submissions fail with the message `reject` if set.
+  `delay`, `faults` and `drops` map a method name to a delay in seconds, a
+  number of Faults to raise, and a list of 'before'/'after' connection drops
+  (the connection is closed before or after the call has been handled).
+  """
+  def __init__(self,polls=0,output=None,solution=SOLUTION,scenrep=None,alive=True):
+    self.polls=polls
+    self.output=output or []
+    self.solution=solution
+    self.scenrep=scenrep
+    self.alive=alive
+    self.reject=None
+    self.delay={}
+    self.faults={}
+    self.drops={}
+    self.lock=threading.Lock()
+    self.calls=[]
+    self.submitted=[]
+    self.users=[]
+    self.status={}
+    self.offsets=[]
+    self.killed=[]
+
+  def count(self,method):
+    return self.calls.count(method)
+
+  def takeDrop(self,method):
+    with self.lock:
+      drops = self.drops.get(method)
+      return drops.pop(0) if drops else None
+
+  def _dispatch(self,method,params):
+    with self.lock:
+      self.calls.append(method)
+      faults = self.faults.get(method,0)
+      if faults:
+        self.faults[method] = faults-1
+    if method in self.delay:
+      time.sleep(self.delay[method])
+    if faults:
+      raise xmlrpc.client.Fault(1,"injected fault in %s" % method)
+    return getattr(self,method)(*params)
+
+  def ping(self):
+    return "NeosServer is alive\n" if self.alive else "NeosServer is down\n"
+
+  def listSolversInCategory(self,category):
+    return ["CBC:GAMS","HIGHS:GAMS","IPOPT:GAMS"]
+
+  def submitJob(self,xml,user,interface):
+    if self.reject:
+      return (0,self.reject)
+    with self.lock:
+      self.submitted.append(xml)
+      self.users.append(user)
+      jobNumber = len(self.submitted)
+      self.status[jobNumber] = 0
+    return (jobNumber,"Secret")
+
+  def authenticatedSubmitJob(self,xml,user,password,interface):
+    return self.submitJob(xml,user,interface)
+
+  def printQueue(self):
+    # Like NEOS, only jobs that are still queued or running are listed
+    lines = ["%d %s" % (jobNumber,self.users[jobNumber-1])
+             for (jobNumber,polls) in self.status.items()
+             if polls <= self.polls and jobNumber not in self.killed]
+    return "Running:\n" + "\n".join(lines) + "\n"
+
+  def getJobStatus(self,jobNumber,password):
+    with self.lock:
+      self.status[jobNumber] = self.status.get(jobNumber,0)+1
+      running = self.status[jobNumber] <= self.polls and jobNumber not in self.killed
+    return "Running" if running else "Done"
+
+  def getIntermediateResults(self,jobNumber,password,offset):
+    self.offsets.append(offset)
+    if offset < len(self.output):
+      return (xmlrpc.client.Binary(self.output[offset].encode()),offset+1)
+    return (xmlrpc.client.Binary(b""),offset)
+
+  def getFinalResults(self,jobNumber,password):
+    results = "<results><solu>%s</solu><stat>=0 Stand-in job %d\n</stat><log>stand-in log\n</log>" % \
+              (self.solution,jobNumber)
+    if self.scenrep is not None:
+      results += "<scen>%s</scen>" % self.scenrep.hex()
+    return xmlrpc.client.Binary((results+"</results>").encode())
+
+  def checkSubmission(self,jobNumber):
+    """
+    Not part of NEOS: returns the size of a submitted document and the error
+    found when parsing it, for checks from another process
+    """
+    document = self.submitted[jobNumber-1]
+    try:
+      xml.dom.minidom.parseString(document).unlink()
+      error = ""
+    except Exception as e:
+      error = str(e)
+    return (len(document.encode()),error)
+
+  def killJob(self,jobNumber,password,reason=""):
+    self.killed.append(jobNumber)
+    return "Job %d has been killed" % jobNumber
+
+class StandinHandler(SimpleXMLRPCRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def do_POST(self):
+    data = self.rfile.read(int(self.headers["content-length"]))
+    (params,method) = xmlrpc.client.loads(data)
+    drop = self.server.neos.takeDrop(method)
+    if drop == "before":
+      self.close_connection = True
+      return
+    response = self.server._marshaled_dispatch(data)
+    if drop == "after":
+      self.close_connection = True
+      return
+    self.send_response(200)
+    self.send_header("Content-Type","text/xml")
+    self.send_header("Content-Length",str(len(response)))
+    self.end_headers()
+    self.wfile.write(response)
+
+  def log_message(self,format,*args):
+    pass
+
+class StandinServer(ThreadingMixIn,SimpleXMLRPCServer):
+  daemon_threads = True
+
+def start(neos,idleTimeout=None):
+  """
+  Serve `neos` on a free local port and return (server, url).  With
+  `idleTimeout` keep-alive connections are closed after that many idle
+  seconds, like the proxies in front of NEOS do.
+  """
+  handler = type("Handler",(StandinHandler,),{'timeout': idleTimeout})
+  server = StandinServer(("127.0.0.1",0),requestHandler=handler,logRequests=False,allow_none=True)
+  server.neos = neos
+  server.register_instance(neos)
+  threading.Thread(target=server.serve_forever,daemon=True).start()
+  return (server,"http://127.0.0.1:%d" % server.server_address[1])
+
+def makeJob(directory,url,options="",solver="cbc"):
+  """
+  Write a small GAMS scratch directory for an LP solved on `url` (with
+  kestrel_solver `solver` unless it is None) and return the name of its
+  control file.
+  """
+  os.makedirs(directory,exist_ok=True)
+  d = directory+os.sep
+  lines = ["42\n","1 0 0\n","10 20 30 4 5\n"]+["0\n"]*9+["0 1\n","0\n","0\n","0\n","0\n",
+           d+"gamsmatr.dat\n",d+"gamsinst.dat\n",d+"kestrel.opt\n",d+"gamsstat.dat\n",
+           d+"gamssolu.dat\n",d+"gamslog.dat\n",d+"gamsdict.dat\n","2\n","0\n","0\n","0\n","0\n",d+"\n"]
+  lines += ["0\n"]*(50-len(lines))
+  lines += ["x\n"]*11+["dat\n","x\n"]
+  with open(d+"gamscntr.dat","w") as f:
+    f.write("".join(lines))
+  with open(d+"gamsmatr.dat","wb") as f:
+    f.write(b"matrix"*100)
+  with open(d+"gamsinst.dat","wb") as f:
+    f.write(b"inst")
+  with open(d+"kestrel.opt","w") as f:
+    if solver:
+      f.write("kestrel_solver %s\n" % solver)
+    f.write("neos_server %s\nemail kestrel@example.org\nkestrel_cache_dir %scache\n%s" % (url,d,options))
+  return d+"gamscntr.dat"
+
+if __name__=="__main__":
+  # Serve a stand-in in its own process: python standin.py [polls]
+  (server,url) = start(StandinNeos(polls=int(sys.argv[1]) if len(sys.argv) > 1 else 0))
+  print(url,flush=True)
+  threading.Event().wait()
@@ -0,0 +1,67 @@
+import os
+import time
+
+import gmske_nx
+import standin
+
+FAILED = "  1 14.0\n  2 13.0\n  3 0\n  4 0.0\n  5 0.0\n  0 0.0\n"
+INTERRUPTED = "  1 8.0\n  2 3.0\n  3 1000\n  4 60.0\n  5 7.0\n  0 0.0\n"
+
+def solveTwice(neos,run,tmp_path,solution):
+  (server,url) = neos(standin.StandinNeos(solution=solution))
+  cntr = standin.makeJob(str(tmp_path/"job"),url)
+  run(cntr)
+  run(cntr)
+  return server
+
+def log(tmp_path):
+  with open(tmp_path/"job"/"gamslog.dat") as f:
+    return f.read()
+
+def test_normal_completion_is_reused(neos,run,tmp_path):
+  server = solveTwice(neos,run,tmp_path,standin.SOLUTION)
+  assert len(server.submitted) == 1
+  assert "Reusing cached NEOS results" in log(tmp_path)
+  with open(tmp_path/"job"/"gamssolu.dat") as f:
+    assert f.read().startswith("  1 1.0\n  2 1.0\n")
+
+def test_failed_solve_is_not_cached(neos,run,tmp_path):
+  server = solveTwice(neos,run,tmp_path,FAILED)
+  assert len(server.submitted) == 2
+  cache = tmp_path/"job"/"cache"
+  assert not cache.exists() or not os.listdir(cache)
+
+def test_interrupted_solve_is_not_cached(neos,run,tmp_path):
+  server = solveTwice(neos,run,tmp_path,INTERRUPTED)
+  assert len(server.submitted) == 2
+
+def test_cache_can_be_disabled(neos,run,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\n")
+  run(cntr)
+  run(cntr)
+  assert len(server.submitted) == 2
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+  cache = gmske_nx.KestrelResultCache(str(tmp_path/"cache"),25000)
+  entries = dict([(key,os.urandom(10000)) for key in "abcd"])
+  for key in "abc":
+    cache.store(key,entries[key])
+    time.sleep(0.02)
+  assert sorted(os.listdir(tmp_path/"cache")) == ["b.xml.gz","c.xml.gz"]
+  assert cache.lookup("a") is None
+  time.sleep(0.02)
+  assert cache.lookup("b") == entries["b"]
+  time.sleep(0.02)
+  cache.store("d",entries["d"])
+  assert cache.lookup("c") is None
+  assert cache.lookup("b") == entries["b"]
+  assert cache.lookup("d") == entries["d"]
+
+def test_cache_hit_closes_document(neos,run,tmp_path,monkeypatch):
+  closed = []
+  close = gmske_nx.KestrelDocumentWriter.close
+  monkeypatch.setattr(gmske_nx.KestrelDocumentWriter,'close',lambda self: closed.append(self) or close(self))
+  solveTwice(neos,run,tmp_path,standin.SOLUTION)
+  assert len(closed) == 2
+  assert closed[1].file.closed
@@ -0,0 +1,55 @@
+import os
+import signal
+import threading
+
+import standin
+
+def read(tmp_path,name):
+  with open(tmp_path/"job"/name) as f:
+    return f.read()
+
+def handlers():
+  return (signal.getsignal(signal.SIGINT),signal.getsignal(signal.SIGTERM))
+
+def interrupt(neos,run,tmp_path,signum,options):
+  (server,url) = neos(standin.StandinNeos(polls=1000))
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\n"+options)
+  timer = threading.Timer(0.3,os.kill,(os.getpid(),signum))
+  timer.start()
+  try:
+    assert run(cntr) == 0
+  finally:
+    timer.cancel()
+  return server
+
+def test_deadline_kills_job(neos,run,tmp_path):
+  (server,url) = neos(standin.StandinNeos(polls=1000))
+  before = handlers()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\nkestrel_deadline 1\n")
+  assert run(cntr) == 0
+  assert server.killed == [1]
+  assert "Deadline of 1 s exceeded" in read(tmp_path,"gamslog.dat")
+  assert read(tmp_path,"gamsstat.dat").startswith("=0 Kestrel")
+  assert read(tmp_path,"gamssolu.dat").startswith("  1 6.0000000000000000E+00\n")
+  assert handlers() == before
+
+def test_terminate_detaches_job(neos,run,tmp_path):
+  before = handlers()
+  server = interrupt(neos,run,tmp_path,signal.SIGTERM,"kestrel_interrupt detach\n")
+  assert server.killed == []
+  log = read(tmp_path,"gamslog.dat")
+  assert "Terminated" in log
+  assert "kestrel_job 1\nkestrel_pass Secret\n" in log
+  assert handlers() == before
+
+def test_keyboard_interrupt_kills_job(neos,run,tmp_path):
+  before = handlers()
+  server = interrupt(neos,run,tmp_path,signal.SIGINT,"")
+  assert server.killed == [1]
+  assert "Keyboard Interrupt" in read(tmp_path,"gamslog.dat")
+  assert handlers() == before
+
+def test_ask_without_terminal_detaches_job(neos,run,tmp_path):
+  server = interrupt(neos,run,tmp_path,signal.SIGINT,"kestrel_interrupt ask\n")
+  assert server.killed == []
+  assert "kestrel_job 1\n" in read(tmp_path,"gamslog.dat")
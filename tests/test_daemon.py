@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+
+import pytest
+
+import standin
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+client = os.path.join(root,'gmske_nx.py')
+launcher = os.path.join(root,'gmske_dc.py')
+
+@pytest.fixture
+def daemon(tmp_path):
+  socketPath = str(tmp_path/"daemon.sock")
+  process = subprocess.Popen([sys.executable,client,'--daemon',socketPath],stdout=subprocess.PIPE,text=True)
+  assert process.stdout.readline().startswith("Kestrel daemon listening")
+  yield socketPath
+  process.terminate()
+  process.wait()
+
+def launch(socketPath,cntr,env=None):
+  return subprocess.run([sys.executable,launcher,socketPath,client,cntr],
+                        capture_output=True,text=True,env=env,timeout=60)
+
+def test_solve_through_daemon(neos,daemon,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\n")
+  # Far more than one read of the request
+  env = dict(os.environ)
+  for n in range(5):
+    env["KESTREL_PADDING%d" % n] = "x"*100000
+  for n in range(2):
+    result = launch(daemon,cntr,env)
+    assert result.returncode == 0, result.stderr
+  assert len(server.submitted) == 2
+  # The second solve reuses the catalog of the first one
+  assert server.count('ping') == 1
+
+def test_stalled_launcher_does_not_block(neos,daemon,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\n")
+  stalled = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+  stalled.connect(daemon)
+  start = time.time()
+  try:
+    result = launch(daemon,cntr)
+  finally:
+    stalled.close()
+  assert result.returncode == 0, result.stderr
+  assert time.time() - start < 15
+  assert len(server.submitted) == 1
+
+def test_launcher_without_daemon(neos,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\n")
+  result = launch(str(tmp_path/"missing.sock"),cntr)
+  assert result.returncode == 0, result.stderr
+  assert len(server.submitted) == 1
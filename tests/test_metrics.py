@@ -0,0 +1,55 @@
+import json
+
+import gmske_nx
+import standin
+
+def options(tmp_path):
+  return "kestrel_metrics_file %s\nkestrel_prometheus_file %s\n" % \
+         (tmp_path/"metrics.jsonl",tmp_path/"kestrel.prom")
+
+def records(tmp_path):
+  with open(tmp_path/"metrics.jsonl") as f:
+    return [json.loads(line) for line in f]
+
+def textfile(tmp_path):
+  with open(tmp_path/"kestrel.prom") as f:
+    return f.read()
+
+def test_solve_is_recorded(neos,run,tmp_path):
+  (server,url) = neos(standin.StandinNeos(polls=2))
+  cntr = standin.makeJob(str(tmp_path/"job"),url,options(tmp_path) + "kestrel_cache 0\n")
+  assert run(cntr) == 0
+  [record] = records(tmp_path)
+  assert (record['job'],record['solver'],record['status'],record['polls']) == (1,"cbc","done",3)
+  prom = textfile(tmp_path)
+  assert 'kestrel_jobs_total{solver="cbc",status="done"} 1\n' in prom
+  assert "# TYPE kestrel_run_seconds summary\n" in prom
+  assert 'kestrel_run_seconds_count{solver="cbc",status="done"} 1\n' in prom
+  assert 'kestrel_queue_wait_seconds_count{solver="cbc",status="done"} 1\n' in prom
+  assert "None" not in prom
+
+def test_every_action_is_recorded(neos,run,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,options(tmp_path))
+  assert run("submit",cntr) == 0
+  assert run("retrieve",cntr) == 0
+  with open(tmp_path/"job"/"kestrel.opt","a") as f:
+    f.write("kestrel_job 1\nkestrel_pass Secret\n")
+  assert run("kill",cntr) == 0
+  assert [record['status'] for record in records(tmp_path)] == ["submitted","done","killed"]
+  assert server.killed == [1]
+  prom = textfile(tmp_path)
+  for status in ["submitted","done","killed"]:
+    assert 'kestrel_jobs_total{solver="cbc",status="%s"} 1\n' % status in prom
+
+def test_labels_are_escaped(tmp_path):
+  cntr = standin.makeJob(str(tmp_path/"job"),"http://127.0.0.1:1",options(tmp_path))
+  client = gmske_nx.KestrelGamsClient(['gmske_nx.py',cntr])
+  client.parseControlFile()
+  client.parseOptionsFile()
+  client.writePrometheus({'time': 1.0,'solver': 'a"b\\c\nd','status': "done"})
+  client.writePrometheus({'time': 2.0,'solver': None,'status': "error"})
+  prom = textfile(tmp_path)
+  assert 'kestrel_jobs_total{solver="a\\"b\\\\c\\nd",status="done"} 1\n' in prom
+  assert 'kestrel_jobs_total{solver="",status="error"} 1\n' in prom
+  assert "kestrel_run_seconds" not in prom
@@ -0,0 +1,84 @@
+import time
+import xmlrpc.client
+import urllib.parse
+
+import pytest
+
+import gmske_nx
+import standin
+
+def endpoint(url):
+  parts = urllib.parse.urlsplit(url)
+  return gmske_nx.KestrelEndpoint(parts.scheme,parts.hostname,parts.port,None)
+
+def pool(*urls,hedgeDelay=2.0):
+  messages = []
+  servers = gmske_nx.KestrelServerPool([endpoint(url) for url in urls],hedgeDelay,messages.append)
+  servers.retryDelay = 0.01
+  return (servers,messages)
+
+def test_dead_primary_is_skipped(neos):
+  (dead,deadUrl) = neos(standin.StandinNeos(alive=False))
+  (live,liveUrl) = neos()
+  (servers,messages) = pool(deadUrl,liveUrl)
+  servers.connect()
+  assert servers.endpoints[0].url == liveUrl
+  assert servers.getJobStatus(1,"pw") == "Done"
+  assert dead.count('getJobStatus') == 0
+  assert "Connecting to: %s\n" % liveUrl in messages
+
+def test_unreachable_primary_is_skipped(neos):
+  (live,liveUrl) = neos()
+  (servers,messages) = pool("http://127.0.0.1:1",liveUrl)
+  servers.connect()
+  assert servers.endpoints[0].url == liveUrl
+
+def test_no_alive_endpoint(neos):
+  (dead,deadUrl) = neos(standin.StandinNeos(alive=False))
+  (servers,messages) = pool(deadUrl)
+  with pytest.raises(gmske_nx.KestrelException):
+    servers.connect()
+
+def test_slow_primary_is_hedged(neos):
+  (slow,slowUrl) = neos()
+  (fast,fastUrl) = neos()
+  slow.delay['getJobStatus'] = 1.0
+  (servers,messages) = pool(slowUrl,fastUrl,hedgeDelay=0.1)
+  start = time.time()
+  assert servers.getJobStatus(1,"pw") == "Done"
+  assert time.time()-start < 0.8
+  assert servers.hedges == 1
+  assert servers.endpoints[1].hedgeWins == 1
+  assert fast.count('getJobStatus') == 1
+
+def test_fast_primary_is_not_hedged(neos):
+  (primary,primaryUrl) = neos()
+  (secondary,secondaryUrl) = neos()
+  (servers,messages) = pool(primaryUrl,secondaryUrl,hedgeDelay=0.5)
+  servers.getJobStatus(1,"pw")
+  assert servers.hedges == 0
+  assert secondary.count('getJobStatus') == 0
+
+def test_failed_submission_is_not_repeated_elsewhere(neos):
+  (primary,primaryUrl) = neos()
+  (secondary,secondaryUrl) = neos()
+  primary.drops['submitJob'] = ['after']
+  (servers,messages) = pool(primaryUrl,secondaryUrl)
+  with pytest.raises(gmske_nx.transportErrors):
+    servers.submitJob("<document/>","user","kestrel")
+  assert len(primary.submitted) == 1
+  assert len(secondary.submitted) == 0
+
+def test_faults_are_recorded(neos):
+  (server,url) = neos()
+  server.faults['getJobStatus'] = 1
+  (servers,messages) = pool(url)
+  with pytest.raises(xmlrpc.client.Fault):
+    servers.getJobStatus(1,"pw")
+  primary = servers.endpoints[0]
+  assert (primary.calls,primary.faults,primary.failures) == (1,1,0)
+  assert len(primary.idle) == 1
+  assert servers.getJobStatus(1,"pw") == "Done"
+  assert primary.calls == 2
+  servers.logStats()
+  assert any("1 fault(s)" in message for message in messages)
@@ -0,0 +1,34 @@
+import os
+import re
+import time
+
+import standin
+
+def submit(neos,run,tmp_path,options):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\n" + options)
+  # Incompressible, so the request carries about 400 KB
+  with open(tmp_path/"job"/"gamsmatr.dat","wb") as f:
+    f.write(os.urandom(300000))
+  start = time.time()
+  assert run(cntr) == 0
+  elapsed = time.time() - start
+  with open(tmp_path/"job"/"gamslog.dat") as f:
+    return (server,elapsed,f.read())
+
+def test_upload_progress_and_rate_limit(neos,run,tmp_path):
+  (server,elapsed,log) = submit(neos,run,tmp_path,
+                                "kestrel_progress_interval 0.2\nkestrel_max_upload_rate 200\n")
+  assert len(server.submitted) == 1
+  progress = re.findall(r"Upload: [\d.]+ of [\d.]+ MB, .*\(limited to 200 KB/s by kestrel_max_upload_rate\)\n",log)
+  assert len(progress) >= 3
+  m = re.search(r"Upload: ([\d.]+) MB in ([\d.]+) s",log)
+  assert m
+  # 0.4 MB at 200 KB/s
+  assert float(m.group(2)) >= 1.6
+  assert elapsed >= 1.6
+
+def test_no_progress_for_fast_uploads(neos,run,tmp_path):
+  (server,elapsed,log) = submit(neos,run,tmp_path,"")
+  assert "Upload:" not in log
+  assert elapsed < 1.6
@@ -0,0 +1,94 @@
+import time
+import urllib.parse
+
+import gmske_nx
+import standin
+
+RETRIES = "kestrel_retry_delay 0.01\nkestrel_cache 0\n"
+
+def solve(neos,run,tmp_path,server,options=RETRIES,idleTimeout=None):
+  (server,url) = neos(server,idleTimeout)
+  cntr = standin.makeJob(str(tmp_path/"job"),url,options)
+  code = run(cntr)
+  with open(tmp_path/"job"/"gamslog.dat") as f:
+    return (server,code,f.read())
+
+def test_dropped_poll_is_retried(neos,run,tmp_path):
+  server = standin.StandinNeos(polls=3)
+  server.drops['getJobStatus'] = ['after','after','after']
+  (server,code,log) = solve(neos,run,tmp_path,server)
+  assert code == 0
+  assert len(server.submitted) == 1
+  assert "NEOS call getJobStatus failed" in log
+  assert "Solve statistics" in log
+
+def test_submission_dropped_before_handling_is_resubmitted(neos,run,tmp_path):
+  server = standin.StandinNeos(polls=1)
+  server.drops['submitJob'] = ['before']
+  (server,code,log) = solve(neos,run,tmp_path,server)
+  assert code == 0
+  assert len(server.submitted) == 1
+  assert "NEOS has no job from it; resubmitting" in log
+  assert "Solve statistics" in log
+
+def test_submission_dropped_after_handling_is_not_resubmitted(neos,run,tmp_path):
+  server = standin.StandinNeos(polls=1)
+  server.drops['submitJob'] = ['after']
+  (server,code,log) = solve(neos,run,tmp_path,server)
+  assert len(server.submitted) == 1
+  assert "NEOS queued the job" in log
+  assert "not resubmitting" in log
+
+def test_output_resumes_from_last_offset(neos,run,tmp_path):
+  server = standin.StandinNeos(polls=4,output=["first chunk\n","second chunk\n","third chunk\n"])
+  server.drops['getIntermediateResults'] = [None,'after','after']
+  (server,code,log) = solve(neos,run,tmp_path,server)
+  assert code == 0
+  for chunk in ["first chunk\n","second chunk\n","third chunk\n"]:
+    assert log.count(chunk) == 1
+  assert server.offsets[:3] == [0,1,1]
+
+def test_idle_connections_closed_by_server(neos,run,tmp_path,monkeypatch):
+  # The stand-in closes keep-alive connections idle for 0.1 s, polls come
+  # every 0.3 s: each poll finds its connection closed and silently reopens it
+  monkeypatch.setattr(gmske_nx.KestrelGamsClient,'pollInterval',0.3)
+  server = standin.StandinNeos(polls=3,output=["some output\n"])
+  options = RETRIES + "neos_username user\nneos_user_password secret\n"
+  (server,code,log) = solve(neos,run,tmp_path,server,options,idleTimeout=0.1)
+  assert code == 0
+  assert len(server.submitted) == 1
+  assert "NEOS call" not in log and "Submission" not in log
+  assert log.count("some output\n") == 1
+
+def test_submission_uses_new_connection(neos):
+  (server,url) = neos(idleTimeout=0.1)
+  parts = urllib.parse.urlsplit(url)
+  messages = []
+  servers = gmske_nx.KestrelServerPool([gmske_nx.KestrelEndpoint(parts.scheme,parts.hostname,parts.port,None)],
+                                       2.0,messages.append)
+  servers.connect()
+  time.sleep(0.3)
+  assert servers.authenticatedSubmitJob("<document/>","user","secret","kestrel") == [1,"Secret"]
+  time.sleep(0.3)
+  assert servers.getJobStatus(1,"Secret") == "Done"
+  assert servers.retries == 0
+  assert servers.endpoints[0].failures == 0
+
+def test_retrieve_gives_up_on_lost_connection(neos,run,tmp_path):
+  (server,url) = neos(standin.StandinNeos(polls=3))
+  cntr = standin.makeJob(str(tmp_path/"job"),url,RETRIES+"kestrel_retries 1\n")
+  assert run("submit",cntr) == 0
+  server.drops['getJobStatus'] = ['after','before']*5
+  assert run("retrieve",cntr) == 0
+  with open(tmp_path/"job"/"gamslog.dat") as f:
+    log = f.read()
+  assert "Lost connection to NEOS" in log
+  assert "kestrel_job 1\nkestrel_pass Secret\n" in log
+
+def test_kill_gives_up_on_lost_connection(neos,run,tmp_path):
+  (server,url) = neos()
+  server.drops['killJob'] = ['after','before']*5
+  cntr = standin.makeJob(str(tmp_path/"job"),url,RETRIES+"kestrel_retries 1\nkestrel_job 1\nkestrel_pass Secret\n")
+  assert run("kill",cntr) == 0
+  with open(tmp_path/"job"/"gamslog.dat") as f:
+    assert "Lost connection to NEOS" in f.read()
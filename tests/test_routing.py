@@ -0,0 +1,47 @@
+import pytest
+
+import gmske_nx
+import standin
+
+ROUTE = "kestrel_route rows<=5000 short highs\n"
+
+def routed(tmp_path,options,solver="cbc"):
+  cntr = standin.makeJob(str(tmp_path/"job"),"http://127.0.0.1:1",options,solver)
+  client = gmske_nx.KestrelGamsClient(['gmske_nx.py',cntr])
+  client.parseControlFile()
+  client.parseOptionsFile()
+  client.routeModel()
+  return (client.solverName,client.priority)
+
+def test_route_picks_solver_and_priority(tmp_path):
+  assert routed(tmp_path,ROUTE,solver=None) == ("highs","short")
+
+def test_explicit_solver_wins(tmp_path):
+  assert routed(tmp_path,ROUTE) == ("cbc","short")
+
+def test_explicit_priority_wins(tmp_path):
+  assert routed(tmp_path,ROUTE + "kestrel_priority long\n",solver=None) == ("highs","long")
+
+def test_no_matching_rule(tmp_path):
+  assert routed(tmp_path,"kestrel_route rows>5000 short highs\n",solver=None) == (None,"long")
+
+def test_default_routes(tmp_path):
+  assert routed(tmp_path,"kestrel_routing 1\n") == ("cbc","short")
+
+def test_invalid_number_is_reported(tmp_path):
+  with pytest.raises(gmske_nx.KestrelException) as e:
+    routed(tmp_path,"kestrel_route rows<=5k short highs\n")
+  assert "Invalid number '5k'" in e.value.msg
+
+def test_unknown_statistic_is_reported(tmp_path):
+  with pytest.raises(gmske_nx.KestrelException) as e:
+    routed(tmp_path,"kestrel_route row<=5 short highs\n")
+  assert "Unknown model statistic 'row'" in e.value.msg
+
+def test_invalid_route_ends_solve_with_error(neos,run,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_route rows<=5k short highs\n")
+  assert run(cntr) == 0
+  assert server.submitted == []
+  with open(tmp_path/"job"/"gamslog.dat") as f:
+    assert "Invalid number '5k'" in f.read()
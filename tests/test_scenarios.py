@@ -0,0 +1,47 @@
+import standin
+
+OUTPUT = ["Iteration 1\n@@scen",
+          "rep 1 3 6162\n",
+          "more output\n@@scenrep 2 3 63",
+          "64\nline\n",
+          "@@scenrep 3 3 6566"]
+
+def solve(neos,run,tmp_path,server):
+  (server,url) = neos(server)
+  job = tmp_path/"job"
+  cntr = standin.makeJob(str(job),url,"kestrel_scenario_stream 1\n")
+  with open(job/"scenario_dict.dat","wb") as f:
+    f.write(b"scenario dictionary")
+  assert run(cntr) == 0
+  with open(job/"gamslog.dat") as f:
+    log = f.read()
+  return (server,job,log)
+
+def scenrep(job):
+  with open(job/"scenrep.dat","rb") as f:
+    return f.read()
+
+def test_streamed_results_are_appended(neos,run,tmp_path):
+  (server,job,log) = solve(neos,run,tmp_path,standin.StandinNeos(polls=5,output=OUTPUT))
+  assert "<scenariostream>1</scenariostream>" in server.submitted[0]
+  assert scenrep(job) == b"abcdef"
+  for n in [1,2,3]:
+    assert "Scenario results: %d/3 received\n" % n in log
+  assert "Iteration 1\nScenario results: 1/3" in log
+  assert "more output\n" in log and "line\n" in log
+  assert "@@scenrep" not in log
+
+def test_final_results_replace_streamed_ones(neos,run,tmp_path):
+  (server,job,log) = solve(neos,run,tmp_path,standin.StandinNeos(polls=5,output=OUTPUT,scenrep=b"all"))
+  assert scenrep(job) == b"all"
+
+def test_leftover_output_is_written(neos,run,tmp_path):
+  output = ["last line\n@@sc"]
+  (server,job,log) = solve(neos,run,tmp_path,standin.StandinNeos(polls=1,output=output))
+  assert "last line\n@@sc\n" in log
+
+def test_corrupt_line_is_passed_on(neos,run,tmp_path):
+  output = ["@@scenrep 1 3 zz\n"]
+  (server,job,log) = solve(neos,run,tmp_path,standin.StandinNeos(polls=1,output=output))
+  assert "Warning: corrupt scenario result line\n@@scenrep 1 3 zz\n" in log
+  assert not (job/"scenrep.dat").exists()
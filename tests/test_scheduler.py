@@ -0,0 +1,65 @@
+import json
+import time
+
+import gmske_nx
+import standin
+
+def state(directory):
+  with open(directory/"anonymous.json") as f:
+    return json.load(f)
+
+def schedOptions(tmp_path):
+  return "kestrel_max_jobs 1\nkestrel_sched_dir %s\n" % (tmp_path/"sched")
+
+def test_slot_released_after_solve(neos,run,tmp_path):
+  (server,url) = neos(standin.StandinNeos(polls=2))
+  cntr = standin.makeJob(str(tmp_path/"job"),url,schedOptions(tmp_path))
+  assert run(cntr) == 0
+  assert state(tmp_path/"sched")['jobs'] == {}
+
+def test_slot_released_after_rejected_submission(neos,run,tmp_path):
+  (server,url) = neos()
+  server.reject = "Error: solver is not available"
+  cntr = standin.makeJob(str(tmp_path/"job"),url,schedOptions(tmp_path))
+  run(cntr)
+  assert state(tmp_path/"sched")['jobs'] == {}
+  assert state(tmp_path/"sched")['queue'] == []
+
+def test_slot_released_after_submit_action(neos,run,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,schedOptions(tmp_path))
+  assert run("submit",cntr) == 0
+  assert len(server.submitted) == 1
+  assert state(tmp_path/"sched")['jobs'] == {}
+
+def foreignJob(directory,beat):
+  directory.mkdir()
+  ticket = "elsewhere:1234:%f" % (time.time()-3600)
+  with open(directory/"anonymous.json","w") as f:
+    json.dump({'jobs': {ticket: {'priority': 'long'}}, 'queue': [], 'beats': {ticket: beat}},f)
+
+def test_foreign_job_without_heartbeat_is_dropped(tmp_path):
+  foreignJob(tmp_path/"sched",time.time()-3600)
+  scheduler = gmske_nx.KestrelScheduler(str(tmp_path/"sched"),"anonymous",0,5,1)
+  (wait,ahead) = scheduler.acquireSlot('long')
+  scheduler.releaseSlot()
+  assert (ahead,wait < 0.5) == (0,True)
+
+def test_foreign_job_with_heartbeat_is_kept(tmp_path):
+  foreignJob(tmp_path/"sched",time.time())
+  scheduler = gmske_nx.KestrelScheduler(str(tmp_path/"sched"),"anonymous",0,5,1)
+  scheduler.heartbeatTimeout = 1.0
+  (wait,ahead) = scheduler.acquireSlot('long')
+  scheduler.releaseSlot()
+  assert ahead == 1
+  assert wait >= 0.5
+
+def test_heartbeat_is_refreshed(tmp_path):
+  scheduler = gmske_nx.KestrelScheduler(str(tmp_path/"sched"),"anonymous",0,5,1)
+  scheduler.heartbeatInterval = 0.05
+  scheduler.acquireSlot('long')
+  first = state(tmp_path/"sched")['beats'][scheduler.ticket]
+  time.sleep(0.3)
+  assert state(tmp_path/"sched")['beats'][scheduler.ticket] > first
+  scheduler.releaseSlot()
+  assert state(tmp_path/"sched")['beats'] == {}
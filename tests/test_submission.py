@@ -0,0 +1,46 @@
+import gzip
+import base64
+import xmlrpc.client
+import xml.dom.minidom
+
+import gmske_nx
+import standin
+
+def submitted(neos,run,tmp_path,options=""):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\n" + options)
+  with open(tmp_path/"job"/"gamsmatr.dat","wb") as f:
+    f.write(bytes(range(256))*4000)
+  assert run(cntr) == 0
+  assert len(server.submitted) == 1
+  return xml.dom.minidom.parseString(server.submitted[0])
+
+def text(doc,tag):
+  return "".join([node.data for node in doc.getElementsByTagName(tag)[0].childNodes])
+
+def test_document_arrives_intact(neos,run,tmp_path):
+  option = "name a<b & c]]>d é中\n"
+  doc = submitted(neos,run,tmp_path,option)
+  assert text(doc,"solver") == "cbc"
+  assert option in text(doc,"options")
+  assert "kestrel_cache" not in text(doc,"options")
+  matr = base64.b64decode(text(doc.getElementsByTagName("matr")[0],"base64"))
+  assert gzip.decompress(matr) == bytes(range(256))*4000
+
+def test_spooled_document_is_streamed(neos,run,tmp_path,monkeypatch):
+  monkeypatch.setattr(gmske_nx.KestrelDocumentWriter,'spoolSize',1024)
+  monkeypatch.setattr(gmske_nx.KestrelTransportMixin,'chunkSize',1000)
+  doc = submitted(neos,run,tmp_path)
+  matr = base64.b64decode(text(doc.getElementsByTagName("matr")[0],"base64"))
+  assert gzip.decompress(matr) == bytes(range(256))*4000
+
+def test_request_body_matches_marshalled_call():
+  document = gmske_nx.KestrelDocumentWriter()
+  document.write("<document>a & b</document>")
+  document.writeCData("x]]>y")
+  body = gmske_nx.KestrelRequestBody("submitJob",(document,"user é","kestrel"))
+  streamed = b"".join(body.chunks(7))
+  expected = xmlrpc.client.dumps(("<document>a & b</document>x]]]]><![CDATA[>y","user é","kestrel"),"submitJob")
+  expected = expected.encode('utf-8','xmlcharrefreplace')
+  assert streamed == expected
+  assert len(body) == len(expected)
@@ -0,0 +1,54 @@
+import gzip
+import base64
+import xml.dom.minidom
+
+import standin
+
+OPTIONS = "kestrel_cache 0\nkestrel_warmstart 1\n"
+FAILED = "  1 14.0\n  2 13.0\n  3 0\n  4 0.0\n  5 0.0\n  0 0.0\n"
+
+def warmStart(document):
+  doc = xml.dom.minidom.parseString(document)
+  node = doc.getElementsByTagName("warmstart")
+  if not node:
+    return None
+  data = "".join([n.data for n in node[0].getElementsByTagName("base64")[0].childNodes])
+  return gzip.decompress(base64.b64decode(data)).decode()
+
+def log(tmp_path):
+  with open(tmp_path/"job"/"gamslog.dat") as f:
+    return f.read()
+
+def test_previous_solution_is_attached(neos,run,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,OPTIONS)
+  assert run(cntr) == 0
+  assert run(cntr) == 0
+  assert warmStart(server.submitted[0]) is None
+  assert warmStart(server.submitted[1]) == standin.SOLUTION
+  assert "Warm start: no previous solution for this model\n" in log(tmp_path)
+  assert "(starting point attached)" in log(tmp_path)
+
+def test_failed_solve_is_not_a_starting_point(neos,run,tmp_path):
+  (server,url) = neos(standin.StandinNeos(solution=FAILED))
+  cntr = standin.makeJob(str(tmp_path/"job"),url,OPTIONS)
+  run(cntr)
+  run(cntr)
+  assert warmStart(server.submitted[1]) is None
+
+def test_user_starting_point_is_attached(neos,run,tmp_path):
+  (server,url) = neos()
+  start = tmp_path/"start.gdx"
+  start.write_text("user point\n")
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_warmstart_file %s\n" % start)
+  assert run(cntr) == 0
+  assert warmStart(server.submitted[0]) == "user point\n"
+  assert "kestrel_warmstart" not in server.submitted[0]
+
+def test_no_warm_start_by_default(neos,run,tmp_path):
+  (server,url) = neos()
+  cntr = standin.makeJob(str(tmp_path/"job"),url,"kestrel_cache 0\n")
+  run(cntr)
+  run(cntr)
+  assert warmStart(server.submitted[1]) is None
+  assert not (tmp_path/"job"/"cache"/"warmstart").exists()